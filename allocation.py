@@ -0,0 +1,209 @@
+import heapq
+import json
+from bisect import bisect_left
+import numpy as np
+
+
+def load_arrays(session, entrant_ids=None):
+    # All applications with entrant totals in one query, as NumPy columns
+    sql = ('SELECT a.entrant_id, a.op, a.priority, e.total, a.consent '
+           'FROM application a JOIN entrant e ON e.id = a.entrant_id')
+    if entrant_ids is None:
+        rows = session.connection().exec_driver_sql(sql).fetchall()
+    else:
+        # Only the given entrants, passed as one JSON parameter
+        rows = session.connection().exec_driver_sql(
+            sql + ' WHERE a.entrant_id IN (SELECT value FROM json_each(?))',
+            (json.dumps(sorted(int(i) for i in entrant_ids)),),
+        ).fetchall()
+    if not rows:
+        return {'entrant_id': np.empty(0, np.int64), 'op': np.empty(0, object), 'priority': np.empty(0, np.int64),
+                'total': np.empty(0, np.int64), 'consent': np.empty(0, bool)}
+    entrant_id, op, priority, total, consent = zip(*rows)
+    return {
+        'entrant_id': np.array(entrant_id, dtype=np.int64),
+        'op': np.array(op, dtype=object),
+        'priority': np.array(priority, dtype=np.int64),
+        'total': np.array(total, dtype=np.int64),
+        'consent': np.array(consent, dtype=bool),
+    }
+
+
+def codes(op, ops):
+    # Program name -> position in ops (-1 when not there), one binary search for all programs
+    names = np.asarray(list(ops), dtype=str)
+    op = np.asarray(op, dtype=str)
+    if not len(names):
+        return np.full(len(op), -1, dtype=np.int64)
+    sorter = np.argsort(names)
+    at = np.minimum(np.searchsorted(names, op, sorter=sorter), len(names) - 1)
+    found = sorter[at]
+    return np.where(names[found] == op, found, -1).astype(np.int64)
+
+
+def prepare(entrant_id, op, priority, total, ops):
+    # Everything deferred acceptance needs that does not depend on consents or
+    # seats, so repeated runs over the same applications can share it
+    op_code = codes(op, ops)
+    e = np.asarray(entrant_id, dtype=np.int64)
+    p = np.asarray(priority, dtype=np.int64)
+    t = np.asarray(total, dtype=np.int64)
+    # Applications of each entrant, best priority first. Priorities are unique per
+    # entrant: validation quarantines a second use of one
+    order = np.lexsort((p, e))
+    # Every program ranks by total desc, ties by entrant id: one merit rank for all
+    merit = np.empty(len(e), dtype=np.int64)
+    merit[np.lexsort((e, -t))] = np.arange(len(e))
+    return {'ops': list(ops), 'order': order, 'entrant': e[order], 'op': op_code[order], 'total': t[order],
+            'merit': merit[order]}
+
+
+def allocate(entrant_id, op, priority, total, consent, spots):
+    # A single run only needs the consented applications
+    keep = np.asarray(consent, dtype=bool)
+    prepared = prepare(*(np.asarray(column)[keep] for column in (entrant_id, op, priority, total)), list(spots))
+    return allocate_prepared(prepared, np.ones(int(keep.sum()), dtype=bool), spots)
+
+
+def allocate_prepared(prepared, consent, spots):
+    # Deferred acceptance over consented applications: every entrant proposes to
+    # the best program (lowest priority number) that has not rejected them yet,
+    # every program keeps its top `spots` by total, rejected entrants move on.
+    ops = prepared['ops']
+    mask = np.asarray(consent, dtype=bool)[prepared['order']] & (prepared['op'] >= 0)
+    e, o, t, m = (prepared[name][mask] for name in ('entrant', 'op', 'total', 'merit'))
+    starts = np.flatnonzero(np.r_[True, e[1:] != e[:-1]]) if len(e) else np.empty(0, np.int64)
+    ends = np.r_[starts[1:], len(e)].astype(np.int64)
+    ptr = starts.copy()
+    capacity = np.array([spots[name] for name in ops], dtype=np.int64)
+    span = max(len(prepared['merit']), 1)
+
+    rounds = 0
+    while True:
+        rounds += 1
+        live = np.flatnonzero(ptr < ends)
+        cand = ptr[live]
+        co, ct, ce = o[cand], t[cand], e[cand]
+        # Rank proposals inside each program by merit
+        ranked = np.argsort(co * span + m[cand], kind='stable')
+        ranked_ops = co[ranked]
+        rank = np.arange(len(ranked)) - np.searchsorted(ranked_ops, ranked_ops, side='left')
+        rejected = ranked[rank >= capacity[ranked_ops]]
+        if not len(rejected):
+            break
+        ptr[live[rejected]] += 1
+
+    admitted = {}
+    cutoffs = {}
+    # ranked is grouped by program, so each program's admitted block is a slice
+    bounds = np.searchsorted(ranked_ops, np.arange(len(ops) + 1))
+    for code, name in enumerate(ops):
+        held = ranked[bounds[code]:bounds[code + 1]]
+        admitted[name] = ce[held]
+        # Passing score only exists when the program is full
+        cutoffs[name] = int(ct[held[-1]]) if len(held) >= capacity[code] and len(held) else None
+    return {'admitted': admitted, 'cutoffs': cutoffs, 'rounds': rounds}
+
+
+class IncrementalAllocation:
+    # Every program ranks entrants by the same (total desc, id) key, so deferred
+    # acceptance is the same as walking entrants best-first and giving each one
+    # their best-priority program with free seats. A change at key k can only
+    # move entrants at or after k, and the walk stops once all programs are full,
+    # so an update costs O(changes + seats) instead of a full recompute.
+
+    def __init__(self, spots):
+        self.spots = dict(spots)
+        self.entrants = {}  # entrant_id -> (key, consented programs by priority)
+        self.by_op = {op: [] for op in self.spots}  # sorted keys of consented applicants
+        self.admitted = {op: [] for op in self.spots}  # sorted keys of admitted entrants
+
+    def reset(self, arrays):
+        self.entrants = {}
+        self.by_op = {op: [] for op in self.spots}
+        self.admitted = {op: [] for op in self.spots}
+        self._add(arrays)
+        for keys in self.by_op.values():
+            keys.sort()
+        self._reallocate(None)
+
+    def update(self, entrant_ids, arrays):
+        # arrays hold the current rows of entrant_ids; ids missing there were deleted
+        boundary = None
+        for entrant_id in entrant_ids:
+            old = self.entrants.pop(int(entrant_id), None)
+            if old is None:
+                continue
+            key, ops = old
+            for op in ops:
+                keys = self.by_op[op]
+                del keys[bisect_left(keys, key)]
+            boundary = key if boundary is None else min(boundary, key)
+        for key in self._add(arrays, insort=True):
+            boundary = key if boundary is None else min(boundary, key)
+        if boundary is not None:
+            self._reallocate(boundary)
+        return boundary
+
+    def result(self):
+        admitted = {}
+        cutoffs = {}
+        for op, keys in self.admitted.items():
+            admitted[op] = np.array([entrant_id for _, entrant_id in keys], dtype=np.int64)
+            cutoffs[op] = -keys[-1][0] if keys and len(keys) >= self.spots[op] else None
+        return {'admitted': admitted, 'cutoffs': cutoffs}
+
+    def _add(self, arrays, insort=False):
+        mask = np.asarray(arrays['consent'], dtype=bool) & np.isin(arrays['op'], list(self.spots))
+        e = np.asarray(arrays['entrant_id'])[mask]
+        o = np.asarray(arrays['op'])[mask]
+        p = np.asarray(arrays['priority'])[mask]
+        t = np.asarray(arrays['total'])[mask]
+        # Same order as allocate: by priority, unique per entrant
+        order = np.lexsort((p, e))
+        added = []
+        for entrant_id, op, total in zip(e[order].tolist(), o[order].tolist(), t[order].tolist()):
+            entry = self.entrants.get(entrant_id)
+            if entry is None:
+                entry = self.entrants[entrant_id] = ((-total, entrant_id), [])
+                added.append(entry[0])
+            entry[1].append(op)
+            keys = self.by_op[op]
+            if insort:
+                keys.insert(bisect_left(keys, entry[0]), entry[0])
+            else:
+                keys.append(entry[0])
+        return added
+
+    def _reallocate(self, boundary):
+        # Keep every admission ranked before the boundary, redo the rest
+        free = {}
+        pos = {}
+        for op, keys in self.admitted.items():
+            if boundary is None:
+                keys.clear()
+                pos[op] = 0
+            else:
+                del keys[bisect_left(keys, boundary):]
+                pos[op] = bisect_left(self.by_op[op], boundary)
+            free[op] = self.spots[op] - len(keys)
+        # Heads of the programs that still have seats; a program that fills up
+        # is dropped when its entry comes to the top
+        heads = [(self.by_op[op][pos[op]], op) for op in self.spots if free[op] > 0 and pos[op] < len(self.by_op[op])]
+        heapq.heapify(heads)
+        while heads:
+            key, op = heads[0]
+            if free[op] <= 0:
+                heapq.heappop(heads)
+                continue
+            # Next entrant who applied to a program that still has seats
+            for op in self.entrants[key[1]][1]:
+                if free[op] > 0:
+                    self.admitted[op].append(key)
+                    free[op] -= 1
+                    break
+            while heads and heads[0][0] == key:
+                _, op = heapq.heappop(heads)
+                pos[op] += 1
+                if free[op] > 0 and pos[op] < len(self.by_op[op]):
+                    heapq.heappush(heads, (self.by_op[op][pos[op]], op))
@@ -1,11 +1,19 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file
+from flask import Flask, Response, render_template, request, redirect, url_for, send_file
 from flask_sqlalchemy import SQLAlchemy
-import pandas as pd
-import matplotlib.pyplot as plt
+from sqlalchemy import event
 import io
-from fpdf import FPDF
-import os
-import random
+import database
+import ingest
+import churn
+import allocation
+import schema
+import programs
+import snapshot
+import daystore
+import history
+import queries
+import pdf_report
+import metrics
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///admission.db'
@@ -17,10 +25,14 @@ class Entrant(db.Model):
     rus = db.Column(db.Integer)
     math = db.Column(db.Integer)
     ind = db.Column(db.Integer)
-    total = db.Column(db.Integer)
+    total = db.Column(db.Integer, index=True)
     applications = db.relationship('Application', backref='entrant', lazy=True, cascade="all, delete-orphan")
 
 class Application(db.Model):
+    __table_args__ = (
+        db.Index('uq_application_entrant_op', 'entrant_id', 'op', unique=True),
+        db.Index('ix_application_op_consent_priority', 'op', 'consent', 'priority', 'entrant_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     entrant_id = db.Column(db.Integer, db.ForeignKey('entrant.id'), nullable=False)
     op = db.Column(db.String(10))
@@ -28,76 +40,125 @@ class Application(db.Model):
     consent = db.Column(db.Boolean)
 
 class PassingScore(db.Model):
+    __table_args__ = (db.Index('ix_passing_score_op_day', 'op', 'day'),)
     id = db.Column(db.Integer, primary_key=True)
     op = db.Column(db.String(10))
     day = db.Column(db.String(10))
-    score = db.Column(db.String(20))
+    score = db.Column(db.Integer)  # None when the program is under-filled (NEDOBOR)
+
+class Program(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # program order
+    code = db.Column(db.String(10), unique=True, nullable=False)
+    name = db.Column(db.String(200))
+    faculty = db.Column(db.String(200))
+    seats = db.Column(db.Integer)
+
+class HistoryDay(db.Model):
+    seq = db.Column(db.Integer, primary_key=True)  # load order
+    day = db.Column(db.String(10))
+
+class AdmittedSpan(db.Model):
+    __table_args__ = (
+        db.Index('ix_admitted_span_op_start', 'op', 'start_seq'),
+        db.Index('ix_admitted_span_entrant', 'entrant_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    op = db.Column(db.String(10))
+    entrant_id = db.Column(db.Integer)
+    start_seq = db.Column(db.Integer)
+    end_seq = db.Column(db.Integer)  # None while still admitted
+
+class SourceState(db.Model):
+    url = db.Column(db.String(500), primary_key=True)
+    etag = db.Column(db.String(200))
+    last_modified = db.Column(db.String(100))
+    sha256 = db.Column(db.String(64))  # of the last loaded copy
+    fetched_at = db.Column(db.Float)
+
+class QuarantinedRow(db.Model):
+    __tablename__ = 'quarantine'
+    __table_args__ = (db.Index('ix_quarantine_day_op', 'day', 'op'),)
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.String(10))
+    op = db.Column(db.String(10))
+    line = db.Column(db.Integer)  # line in the program's CSV
+    entrant_id = db.Column(db.Integer)  # None when the ID itself is unreadable
+    reason = db.Column(db.String(500))
+    data = db.Column(db.Text)  # raw values as JSON
 
 with app.app_context():
-    db.create_all()
+    # Same WAL and cache pragmas as the NiceGUI app; Flask-SQLAlchemy already scopes sessions per request
+    event.listen(db.engine, 'connect', lambda dbapi_connection, record: database.set_pragmas(dbapi_connection))
+    schema.setup(db.engine, db.metadata)
+    metrics.instrument(db.engine, 'write')
+metrics.watch(db.Model)
 
-def load_day(day):
-    ops = ['PM', 'IVT', 'ITSS', 'IB']
-    if day != '01.08':
-        # Apply churn: delete 5-10%, update rest
-        all_entrants = Entrant.query.all()
-        if all_entrants:
-            num_to_delete = random.randint(int(0.05 * len(all_entrants)), int(0.10 * len(all_entrants)))
-            to_delete = random.sample(all_entrants, num_to_delete)
-            for entrant in to_delete:
-                db.session.delete(entrant)
-            db.session.commit()
-            # Update remaining: change some scores or consents
-            remaining = Entrant.query.all()
-            for entrant in remaining:
-                if random.random() < 0.2:  # 20% chance to update
-                    entrant.phys = max(0, entrant.phys + random.randint(-5, 5))
-                    entrant.rus = max(0, entrant.rus + random.randint(-5, 5))
-                    entrant.math = max(0, entrant.math + random.randint(-5, 5))
-                    entrant.ind = max(0, entrant.ind + random.randint(-2, 2))
-                    entrant.total = entrant.phys + entrant.rus + entrant.math + entrant.ind
-                    # Possibly change consents in applications
-                    for app in entrant.applications:
-                        if random.random() < 0.1:  # 10% chance
-                            app.consent = not app.consent
-            db.session.commit()
-    # Load from CSV
-    for op in ops:
-        filepath = f'../{day}_{op}.csv'
-        if os.path.exists(filepath):
-            df = pd.read_csv(filepath)
-            for _, row in df.iterrows():
-                entrant_id = int(row['ID'])
-                entrant = Entrant.query.get(entrant_id)
-                if entrant:
-                    entrant.phys = int(row['Physics'])
-                    entrant.rus = int(row['Russian'])
-                    entrant.math = int(row['Math'])
-                    entrant.ind = int(row['Individual'])
-                    entrant.total = int(row['Total'])
-                else:
-                    entrant = Entrant(id=entrant_id, phys=int(row['Physics']), rus=int(row['Russian']), math=int(row['Math']), ind=int(row['Individual']), total=int(row['Total']))
-                    db.session.add(entrant)
-                # Update application
-                app_exist = Application.query.filter_by(entrant_id=entrant_id, op=op).first()
-                if app_exist:
-                    app_exist.priority = int(row['Priority'])
-                    app_exist.consent = str(row['Consent']).lower() == 'true'
-                else:
-                    app_new = Application(entrant_id=entrant_id, op=op, priority=int(row['Priority']), consent=str(row['Consent']).lower() == 'true')
-                    db.session.add(app_new)
+# Programs, seats and faculties come from the registry table, seeded from seats.json
+with app.app_context():
+    REGISTRY = programs.sync(db.session)
     db.session.commit()
+OPS = programs.codes(REGISTRY)
+SPOTS = programs.spots(REGISTRY)
+FACULTIES = programs.faculties(REGISTRY)
+# Allocation state of the current campaign, kept between loads
+allocator = None
+# Seeded from CHURN_SEED when set
+churn_rng = churn.make_rng()
+
+def load_day(day, frame=None):
+    # frame is the day already parsed by ingest.read_day (replay.py), instead of the CSVs
+    global allocator
+    daystore.check_day(day)
+    ops = OPS
+    # Every program CSV of the day is loaded; lists of programs missing from the
+    # registry (a stray file) are skipped and reported, the rest of the day loads
+    found = ingest.discover(day) if frame is None else frame['op'].unique().tolist()
+    skipped = programs.unregistered(REGISTRY, found)
+    if skipped:
+        print(f"Skipped {day}: programs missing from the registry: {', '.join(skipped)}")
+        if frame is not None:
+            frame = frame[~frame['op'].isin(skipped)]
+    found = [op for op in ops if op in found]
+    changes = {'inserted': set(), 'deleted': set(), 'updated': set()}
+    if day != '01.08':
+        # Apply churn: delete 5-10%, update 20% of the rest
+        deleted, updated = churn.simulate(db.session, churn_rng)
+        changes['deleted'] |= deleted
+        changes['updated'] |= updated
+    # Load from CSV in bulk
+    if frame is None:
+        stats = ingest.load_csvs(db.session, day, found)
+    else:
+        stats = ingest.load_frame(db.session, day, frame)
+    stats['skipped'] = skipped
+    changes['inserted'] |= stats['changes']['inserted']
+    changes['updated'] |= stats['changes']['updated']
+    print(f"Loaded {day}: {stats['rows']} rows in {stats['seconds']:.2f}s ({stats['rows_per_sec']:.0f} rows/sec), "
+          f"{stats['quarantined']} quarantined")
     # Calculate passing scores
-    spots = {'PM': 40, 'IVT': 50, 'ITSS': 30, 'IB': 20}
-    for op in ops:
-        apps = Application.query.filter_by(op=op, consent=True).join(Entrant).order_by(Application.priority, Entrant.total.desc()).all()
-        if len(apps) <= spots[op]:
-            score = "NEDOBOR"
+    # Only the entrants in the change set are re-read; the first load builds the full state
+    try:
+        if allocator is None:
+            allocator = allocation.IncrementalAllocation(SPOTS)
+            allocator.reset(allocation.load_arrays(db.session))
         else:
-            score = str(apps[spots[op] - 1].entrant.total)
-        ps = PassingScore(op=op, day=day, score=score)
-        db.session.add(ps)
-    db.session.commit()
+            changed = changes['inserted'] | changes['deleted'] | changes['updated']
+            allocator.update(changed, allocation.load_arrays(db.session, changed))
+        result = allocator.result()
+        db.session.connection().exec_driver_sql('INSERT INTO passing_score (op, day, score) VALUES (?, ?, ?)',
+                                                [(op, day, result['cutoffs'][op]) for op in ops])
+        history.record(db.session, day, result['admitted'])
+        db.session.commit()
+    except Exception:
+        # The in-memory state may be ahead of the database now
+        allocator = None
+        raise
+    # The committed day is kept as an immutable columnar file; the snapshot reads it back memory-mapped
+    daystore.write(day, queries.applications_frame(db.session), result['cutoffs'])
+    snapshot.publish(snapshot.from_frame(daystore.frame(day), ops, SPOTS, day, result))
+    metrics.inc('loads_total')
+    stats['changes'] = changes
+    return stats
 
 @app.route('/')
 def index():
@@ -105,83 +166,60 @@ def index():
 
 @app.route('/load/<day>')
 def load(day):
-    load_day(day)
+    try:
+        daystore.check_day(day)
+    except ValueError as e:
+        return str(e), 400
+    with metrics.capture(f'load_day {day}'):
+        load_day(day)
     return redirect(url_for('index'))
 
 @app.route('/view/<view_type>')
 def view(view_type):
+    ops = OPS
     if view_type == 'programs':
-        ops = ['PM', 'IVT', 'ITSS', 'IB']
-        data = {}
-        for op in ops:
-            apps = Application.query.filter_by(op=op).join(Entrant).order_by(Entrant.total.desc()).all()
-            data[op] = [{'id': app.entrant.id, 'total': app.entrant.total, 'consent': app.consent, 'priority': app.priority, 'phys': app.entrant.phys, 'rus': app.entrant.rus, 'math': app.entrant.math, 'ind': app.entrant.ind} for app in apps]
+        snap = snapshot.get(db.session, ops, SPOTS)
+        data = {op: frame.to_dict('records') for op, frame in snap.programs.items()}
         return render_template('view_programs.html', data=data)
     elif view_type == 'overall':
-        # Get all entrants with their applications
-        entrants = Entrant.query.all()
+        # Wide per-entrant table, shared by all requests until the next load
+        snap = snapshot.get(db.session, ops, SPOTS)
+        # Applications are grouped from the program lists, not looked up per program column
+        apps = {}
+        for op, frame in snap.programs.items():
+            for entrant_id, priority, consent in frame[['id', 'priority', 'consent']].itertuples(index=False):
+                apps.setdefault(entrant_id, {})[op] = {'priority': int(priority), 'consent': bool(consent)}
+        columns = [title for _, title in queries.ENTRANT_FIELDS]
         data = []
-        for entrant in entrants:
-            apps = {app.op: {'priority': app.priority, 'consent': app.consent} for app in entrant.applications}
+        for row in snap.overall[columns].to_dict('records'):
             data.append({
-                'id': entrant.id,
-                'phys': entrant.phys,
-                'rus': entrant.rus,
-                'math': entrant.math,
-                'ind': entrant.ind,
-                'total': entrant.total,
-                'applications': apps
+                'id': row['ID'],
+                'phys': row['Physics'],
+                'rus': row['Russian'],
+                'math': row['Math'],
+                'ind': row['Individual'],
+                'total': row['Total'],
+                'applications': apps.get(row['ID'], {})
             })
         return render_template('view_overall.html', data=data)
     else:
         return "Invalid view type", 404
 
 def generate_pdf():
-    # Generate PDF
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt="Admission Report", ln=True, align='C')
-    pdf.cell(200, 10, txt="Date and Time: " + str(pd.Timestamp.now()), ln=True)
-    # Passing scores (latest for each OP)
-    pdf.cell(200, 10, txt="Passing Scores", ln=True)
-    ops = ['PM', 'IVT', 'ITSS', 'IB']
-    for op in ops:
-        latest_score = PassingScore.query.filter_by(op=op).order_by(PassingScore.day.desc()).first()
-        score_text = latest_score.score if latest_score else "N/A"
-        pdf.cell(200, 10, txt=f"{op}: {score_text}", ln=True)
-    # Dynamics graphs
-    import tempfile
-    import os
-    for op in ops:
-        scores = [(s.day, int(s.score) if s.score != "NEDOBOR" else 0) for s in PassingScore.query.filter_by(op=op).order_by(PassingScore.day).all()]
-        if scores:
-            days, vals = zip(*scores)
-            plt.figure()
-            plt.plot(days, vals)
-            plt.title(f"Passing Score Dynamics for {op}")
-            plt.xlabel("Day")
-            plt.ylabel("Score")
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-                plt.savefig(tmp.name, format='png')
-                pdf.image(tmp.name, w=100)
-                os.unlink(tmp.name)
-            plt.close()
-    # Enrolled lists
-    pdf.add_page()
-    pdf.cell(200, 10, txt="Enrolled Applicants", ln=True)
-    spots = {'PM': 40, 'IVT': 50, 'ITSS': 30, 'IB': 20}
-    for op in ops:
-        pdf.cell(200, 10, txt=f"{op}", ln=True)
-        apps = Application.query.filter_by(op=op, consent=True).join(Entrant).order_by(Application.priority, Entrant.total.desc()).limit(spots[op]).all()
-        for app in apps:
-            pdf.cell(200, 10, txt=f"ID: {app.entrant.id}, Total: {app.entrant.total}", ln=True)
-    pdf.output("report.pdf")
+    # Rendered once per data version, charts in parallel, entirely in memory
+    snap = snapshot.get(db.session, OPS, SPOTS)
+    return pdf_report.get_report(db.session, snap, FACULTIES)
 
 @app.route('/report')
 def report():
-    generate_pdf()
-    return send_file("report.pdf", as_attachment=True)
+    # ?profile=true captures this request even while profiling is off
+    with metrics.capture('report', request.args.get('profile') == 'true' or None):
+        pdf = generate_pdf()
+    return send_file(io.BytesIO(pdf), mimetype='application/pdf', as_attachment=True, download_name='report.pdf')
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
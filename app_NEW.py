@@ -1,21 +1,57 @@
-from nicegui import ui, app
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, ForeignKey, text
-from sqlalchemy.orm import sessionmaker, relationship, declarative_base
-import pandas as pd
-import matplotlib.pyplot as plt
-import io
-from fpdf import FPDF
+from nicegui import ui, app, run, core, background_tasks, Event
+from sqlalchemy import Column, Integer, Float, String, Text, Boolean, ForeignKey, Index
+from sqlalchemy.orm import relationship, declarative_base
+from fastapi import HTTPException, Response
 import os
-import random
+import asyncio
+import multiprocessing
+import queue
+import tempfile
+import threading
+import database
+import ingest
+import churn
+import allocation
+import schema
+import programs
+import scenarios
+import snapshot
+import daystore
+import history
+import queries
+import pdf_report
+import grid
+import live
+import distribution
+import metrics
+import sources
+import validate
 
 data = '00.00'
-
-# Database setup
-if os.path.exists('admission.db'):
-    os.remove('admission.db')
-engine = create_engine('sqlite:///admission.db')
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Allocation state of the current campaign, kept between loads
+allocator = None
+# Seeded from CHURN_SEED when set
+churn_rng = churn.make_rng()
+# Only one day is loaded at a time
+load_lock = threading.Lock()
+# Every new data version, as a diff against the previous one, for the live dashboards
+data_published = Event()
+# Lists published over HTTP, e.g. https://lists.example/{day}_{op}.csv; polled every SOURCE_POLL seconds
+SOURCE_URL = os.environ.get('SOURCE_URL')
+SOURCE_POLL = float(os.environ.get('SOURCE_POLL', 300))
+
+# Database setup: the campaign survives restarts; RESET_DB=1 starts from an empty one.
+# Spawned worker processes (scenarios) import this module again and must not reset it.
+if os.environ.get('RESET_DB') == '1' and multiprocessing.current_process().name == 'MainProcess':
+    for path in ('admission.db', 'admission.db-wal', 'admission.db-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    daystore.clear()
+engine = database.init('sqlite:///admission.db')
+metrics.instrument(database.engine, 'write')
+metrics.instrument(database.read_engine, 'read')
 Base = declarative_base()
+metrics.watch(Base)
 
 class Entrant(Base):
     __tablename__ = 'entrant'
@@ -24,11 +60,15 @@ class Entrant(Base):
     rus = Column(Integer)
     math = Column(Integer)
     ind = Column(Integer)
-    total = Column(Integer)
+    total = Column(Integer, index=True)
     applications = relationship('Application', backref='entrant', lazy=True, cascade="all, delete-orphan")
 
 class Application(Base):
     __tablename__ = 'application'
+    __table_args__ = (
+        Index('uq_application_entrant_op', 'entrant_id', 'op', unique=True),
+        Index('ix_application_op_consent_priority', 'op', 'consent', 'priority', 'entrant_id'),
+    )
     id = Column(Integer, primary_key=True)
     entrant_id = Column(Integer, ForeignKey('entrant.id'), nullable=False)
     op = Column(String(10))
@@ -37,87 +77,222 @@ class Application(Base):
 
 class PassingScore(Base):
     __tablename__ = 'passing_score'
+    __table_args__ = (Index('ix_passing_score_op_day', 'op', 'day'),)
     id = Column(Integer, primary_key=True)
     op = Column(String(10))
     day = Column(String(10))
-    score = Column(String(20))
-
-Base.metadata.create_all(bind=engine)
-db = SessionLocal()
-
-db.execute(text('PRAGMA foreign_keys=ON'))
-db.commit()
-
-# Clear existing data
-db.execute(text('DELETE FROM entrant'))
-db.execute(text('DELETE FROM application'))
-db.execute(text('DELETE FROM passing_score'))
-db.commit()
-
-def load_day(day):
-    ops = ['PM', 'IVT', 'ITSS', 'IB']
-    if day != '01.08':
-        # Apply churn: delete 5-10%, update rest
-        all_entrants = db.query(Entrant).all()
-        if all_entrants:
-            num_to_delete = random.randint(int(0.05 * len(all_entrants)), int(0.10 * len(all_entrants)))
-            to_delete = random.sample(all_entrants, num_to_delete)
-            for entrant in to_delete:
-                db.delete(entrant)
-            db.commit()
-            # Update remaining: change some scores or consents
-            remaining = db.query(Entrant).all()
-            for entrant in remaining:
-                if random.random() < 0.2:  # 20% chance to update
-                    entrant.phys = max(0, entrant.phys + random.randint(-5, 5))
-                    entrant.rus = max(0, entrant.rus + random.randint(-5, 5))
-                    entrant.math = max(0, entrant.math + random.randint(-5, 5))
-                    entrant.ind = max(0, entrant.ind + random.randint(-2, 2))
-                    entrant.total = entrant.phys + entrant.rus + entrant.math + entrant.ind
-                    # Possibly change consents in applications
-                    for app in entrant.applications:
-                        if random.random() < 0.1:  # 10% chance
-                            app.consent = not app.consent
-            db.commit()
-    # Load from CSV
-    for op in ops:
-        filepath = f'../{day}_{op}.csv'
-        if os.path.exists(filepath):
-            df = pd.read_csv(filepath)
-            for _, row in df.iterrows():
-                entrant_id = int(row['ID'])
-                entrant = db.query(Entrant).filter(Entrant.id == entrant_id).first()
-                if entrant:
-                    entrant.phys = int(row['Physics'])
-                    entrant.rus = int(row['Russian'])
-                    entrant.math = int(row['Math'])
-                    entrant.ind = int(row['Individual'])
-                    entrant.total = int(row['Total'])
-                else:
-                    entrant = Entrant(id=entrant_id, phys=int(row['Physics']), rus=int(row['Russian']), math=int(row['Math']), ind=int(row['Individual']), total=int(row['Total']))
-                    db.add(entrant)
-                # Update application
-                app_exist = db.query(Application).filter(Application.entrant_id == entrant_id, Application.op == op).first()
-                if app_exist:
-                    app_exist.priority = int(row['Priority'])
-                    app_exist.consent = str(row['Consent']).lower() == 'true'
-                else:
-                    app_new = Application(entrant_id=entrant_id, op=op, priority=int(row['Priority']), consent=str(row['Consent']).lower() == 'true')
-                    db.add(app_new)
-    db.commit()
-    # Calculate passing scores
-    spots = {'PM': 40, 'IVT': 50, 'ITSS': 30, 'IB': 20}
-    for op in ops:
-        apps = db.query(Application).filter(Application.op == op, Application.consent == True).join(Entrant).order_by(Application.priority, Entrant.total.desc()).all()
-        if len(apps) <= spots[op]:
-            score = "NEDOBOR"
-        else:
-            score = str(apps[spots[op] - 1].entrant.total)
-        ps = PassingScore(op=op, day=day, score=score)
-        db.add(ps)
-    db.commit()
-
+    score = Column(Integer)  # None when the program is under-filled (NEDOBOR)
+
+class Program(Base):
+    __tablename__ = 'program'
+    id = Column(Integer, primary_key=True)  # program order
+    code = Column(String(10), unique=True, nullable=False)
+    name = Column(String(200))
+    faculty = Column(String(200))
+    seats = Column(Integer)
+
+class HistoryDay(Base):
+    __tablename__ = 'history_day'
+    seq = Column(Integer, primary_key=True)  # load order
+    day = Column(String(10))
 
+class AdmittedSpan(Base):
+    __tablename__ = 'admitted_span'
+    __table_args__ = (
+        Index('ix_admitted_span_op_start', 'op', 'start_seq'),
+        Index('ix_admitted_span_entrant', 'entrant_id'),
+    )
+    id = Column(Integer, primary_key=True)
+    op = Column(String(10))
+    entrant_id = Column(Integer)
+    start_seq = Column(Integer)
+    end_seq = Column(Integer)  # None while still admitted
+
+class SourceState(Base):
+    __tablename__ = 'source_state'
+    url = Column(String(500), primary_key=True)
+    etag = Column(String(200))
+    last_modified = Column(String(100))
+    sha256 = Column(String(64))  # of the last loaded copy
+    fetched_at = Column(Float)
+
+class QuarantinedRow(Base):
+    __tablename__ = 'quarantine'
+    __table_args__ = (Index('ix_quarantine_day_op', 'day', 'op'),)
+    id = Column(Integer, primary_key=True)
+    day = Column(String(10))
+    op = Column(String(10))
+    line = Column(Integer)  # line in the program's CSV
+    entrant_id = Column(Integer)  # None when the ID itself is unreadable
+    reason = Column(String(500))
+    data = Column(Text)  # raw values as JSON
+
+schema.setup(engine, Base.metadata)
+
+# Programs, seats and faculties come from the registry table, seeded from seats.json
+with database.session_scope() as session:
+    REGISTRY = programs.sync(session)
+OPS = programs.codes(REGISTRY)
+SPOTS = programs.spots(REGISTRY)
+FACULTIES = programs.faculties(REGISTRY)
+
+def push_update(previous, snap):
+    # The diff is computed once in the loading thread; dashboards get it on the event loop
+    if core.loop is not None:
+        core.loop.call_soon_threadsafe(data_published.emit, live.change(previous, snap))
+
+snapshot.subscribe(push_update)
+
+def restorable_day(session, day):
+    # The day file is written after the commit, so a crash in between leaves it behind the database
+    if day not in daystore.days():
+        return False
+    conn = session.connection()
+    scores = dict(conn.exec_driver_sql('SELECT op, score FROM passing_score WHERE id IN '
+                                       '(SELECT MAX(id) FROM passing_score WHERE day = ? GROUP BY op)', (day,)).fetchall())
+    count = conn.exec_driver_sql('SELECT COUNT(*) FROM application').scalar()
+    return scores == daystore.cutoffs(day) and count == daystore.read(day).num_rows
+
+def restore():
+    # Warm state after a restart: the snapshot and the allocation of the last
+    # committed day, read back from its memory-mapped day file when it matches
+    global data, allocator
+    with load_lock, database.read_session() as session:
+        days = history.days(session)
+        if not days:
+            return
+        day = days[-1]
+        snap = snapshot.get(session, OPS, SPOTS, day if restorable_day(session, day) else None)
+        if data == '00.00':
+            data = day
+        if allocator is None:
+            allocator = allocation.IncrementalAllocation(SPOTS)
+            allocator.reset(snap.arrays())
+    print(f'Restored {day}: data version {snap.version}')
+
+def warm_start():
+    # Pages are served right away, the restore runs in a worker thread meanwhile
+    background_tasks.create(run.io_bound(restore), name='restore')
+
+app.on_startup(warm_start)
+# The what-if worker processes stop with the server
+app.on_shutdown(scenarios.shutdown)
+
+def load_day(day, session=None, progress=None, frame=None, path='../{day}_{op}.csv', simulate_churn=True):
+    # Without a session the load runs in its own one.
+    # progress(stage, **info) is called as the load moves along.
+    # frame is the day already parsed by ingest.read_day (replay.py), instead of the CSVs.
+    # Fetched lists are real changes, so they are loaded without simulated churn.
+    global allocator
+    daystore.check_day(day)
+    if session is None:
+        with metrics.capture(f'load_day {day}'), database.session_scope() as session:
+            return load_day(day, session, progress, frame, path, simulate_churn)
+    progress = progress or (lambda stage, **info: None)
+    ops = OPS
+    # Every program CSV of the day is loaded; lists of programs missing from the
+    # registry (a stray file) are skipped and reported, the rest of the day loads
+    found = ingest.discover(day, path) if frame is None else frame['op'].unique().tolist()
+    skipped = programs.unregistered(REGISTRY, found)
+    if skipped:
+        print(f"Skipped {day}: programs missing from the registry: {', '.join(skipped)}")
+        if frame is not None:
+            frame = frame[~frame['op'].isin(skipped)]
+    found = [op for op in ops if op in found]
+    changes = {'inserted': set(), 'deleted': set(), 'updated': set()}
+    if day != '01.08' and simulate_churn:
+        # Apply churn: delete 5-10%, update 20% of the rest
+        with metrics.stage('churn'):
+            deleted, updated = churn.simulate(session, churn_rng)
+        changes['deleted'] |= deleted
+        changes['updated'] |= updated
+        progress('churn', deleted=len(changes['deleted']), updated=len(changes['updated']))
+    # Load from CSV in bulk
+    with metrics.stage('ingest'):
+        if frame is None:
+            stats = ingest.load_csvs(session, day, found, path, progress=progress)
+        else:
+            stats = ingest.load_frame(session, day, frame, progress=progress)
+    stats['skipped'] = skipped
+    changes['inserted'] |= stats['changes']['inserted']
+    changes['updated'] |= stats['changes']['updated']
+    print(f"Loaded {day}: {stats['rows']} rows in {stats['seconds']:.2f}s ({stats['rows_per_sec']:.0f} rows/sec), "
+          f"{stats['quarantined']} quarantined")
+    # Calculate passing scores
+    # Only the entrants in the change set are re-read; the first load builds the full state
+    try:
+        with metrics.stage('allocate'):
+            if allocator is None:
+                allocator = allocation.IncrementalAllocation(SPOTS)
+                allocator.reset(allocation.load_arrays(session))
+            else:
+                changed = changes['inserted'] | changes['deleted'] | changes['updated']
+                allocator.update(changed, allocation.load_arrays(session, changed))
+            result = allocator.result()
+        progress('allocated', cutoffs=result['cutoffs'])
+        with metrics.stage('history'):
+            session.connection().exec_driver_sql('INSERT INTO passing_score (op, day, score) VALUES (?, ?, ?)',
+                                                 [(op, day, result['cutoffs'][op]) for op in ops])
+            history.record(session, day, result['admitted'])
+        with metrics.stage('commit'):
+            session.commit()
+    except Exception:
+        # The in-memory state may be ahead of the database now
+        allocator = None
+        raise
+    # The committed day is kept as an immutable columnar file; the snapshot reads it back memory-mapped
+    with metrics.stage('daystore'):
+        daystore.write(day, queries.applications_frame(session), result['cutoffs'])
+    # New data becomes visible to readers only now, after the commit
+    with metrics.stage('snapshot'):
+        snap = snapshot.publish(snapshot.from_frame(daystore.frame(day), ops, SPOTS, day, result))
+    metrics.inc('loads_total')
+    progress('done', version=snap.version)
+    stats['changes'] = changes
+    return stats
+
+
+def fetch_and_load(day):
+    # Only the lists that changed since the last poll are downloaded and loaded;
+    # when none did, nothing is written and no new data version is published
+    daystore.check_day(day)
+    with tempfile.TemporaryDirectory() as directory, database.session_scope() as session:
+        with metrics.stage('fetch'):
+            fetched = sources.fetch(day, OPS, SOURCE_URL, directory, sources.known(session))
+        if fetched['changed']:
+            with metrics.capture(f'fetch_and_load {day}'):
+                load_day(day, session, path=os.path.join(directory, '{day}_{op}.csv'), simulate_churn=False)
+        # Validators of lists that failed stay as they were, so they are asked for in full again
+        sources.save(session, fetched['entries'])
+    print(f"Fetched {day}: {len(fetched['changed'])} changed, {len(fetched['unchanged'])} unchanged, "
+          f"{len(fetched['errors'])} failed")
+    return fetched
+
+async def fetch_locked(day):
+    global data
+    if not load_lock.acquire(blocking=False):
+        return None
+    try:
+        fetched = await run.io_bound(fetch_and_load, day)
+        if fetched['changed']:
+            data = day
+        return fetched
+    finally:
+        load_lock.release()
+
+async def poll_sources():
+    # The day on display is polled; a new day is fetched from the home page or the API first
+    while True:
+        await asyncio.sleep(SOURCE_POLL)
+        if data == '00.00':
+            continue
+        try:
+            await fetch_locked(data)
+        except Exception as e:
+            print(f'Polling {data} failed: {e}')
+
+if SOURCE_URL:
+    app.on_startup(lambda: background_tasks.create(poll_sources(), name='poll_sources'))
 
 @ui.page('/')
 def index():
@@ -127,246 +302,424 @@ def index():
     with ui.row():
         for day in ['01.08', '02.08', '03.08', '04.08']:
             ui.button(f'Load {day}', on_click=lambda d=day: load_and_refresh(d))
+    if SOURCE_URL:
+        with ui.row():
+            for day in ['01.08', '02.08', '03.08', '04.08']:
+                ui.button(f'Fetch {day}', on_click=lambda d=day: fetch_and_refresh(d))
 
     ui.label('View Data').classes('text-h5')
     with ui.row():
         ui.link('View by Programs', '/view/programs')
         ui.link('View Overall List', '/view/overall')
+        ui.link('Live Dashboard', '/dashboard')
+        ui.link('Score Analytics', '/analytics')
 
     ui.label('Report').classes('text-h5')
     ui.button('Generate Report', on_click=generate_report)
 
-def load_and_refresh(day):
+def load_in_background(day, events):
+    # Runs in a worker thread with its own session, so the event loop keeps serving pages
+    return load_day(day, progress=lambda stage, **info: events.put((stage, info)))
+
+def describe_progress(day, stage, info):
+    if stage == 'churn':
+        return f'{day}: churn applied ({info["deleted"]} deleted, {info["updated"]} updated)'
+    if stage == 'parsed':
+        return f'{day}: {info["rows"]} rows parsed'
+    if stage == 'upserted':
+        return f'{day}: {info["rows"]} applications upserted'
+    if stage == 'allocated':
+        return f'{day}: allocation done'
+    return f'{day}: data version {info["version"]} published'
+
+async def load_and_refresh(day):
+    global data
+    if not load_lock.acquire(blocking=False):
+        ui.notify('Another day is still loading', type='warning')
+        return
+    events = queue.Queue()
+    status = ui.notification(f'Loading {day}...', spinner=True, timeout=None)
+
+    def show_progress():
+        while not events.empty():
+            stage, info = events.get_nowait()
+            status.message = describe_progress(day, stage, info)
+
+    timer = ui.timer(0.1, show_progress)
     try:
-        load_day(day)
-        ui.notify(f'Successfully loaded data for {day}')
-        global data 
+        stats = await run.io_bound(load_in_background, day, events)
+        show_progress()
         data = day
+        if stats['quarantined']:
+            ui.notify(f'Loaded {day}; {stats["quarantined"]} invalid rows were quarantined', type='warning')
+        else:
+            ui.notify(f'Successfully loaded data for {day}')
     except Exception as e:
         ui.notify(f'Error loading data for {day}: {str(e)}', type='error')
+    finally:
+        timer.cancel()
+        status.dismiss()
+        load_lock.release()
 
-@ui.page('/view/programs')
-def view_programs():
-    CSV_FILENAME_IB = f'{data}_IB.csv'  # Измените на ваше имя файла
-    CSV_FILENAME_ITSS = f'{data}_ITSS.csv'  # Измените на ваше имя файла
-    CSV_FILENAME_IVT = f'{data}_IVT.csv'  # Измените на ваше имя файла
-    CSV_FILENAME_PM = f'{data}_PM.csv'  # Измените на ваше имя файла
-
-    # Загружаем CSV файл
+async def fetch_and_refresh(day):
+    status = ui.notification(f'Fetching {day}...', spinner=True, timeout=None)
     try:
-        df1 = pd.read_csv(CSV_FILENAME_IB)
-        print(f"Загружен файл: {CSV_FILENAME_IB}")
-        print(f"Строк: {len(df1)}, Столбцов: {len(df1.columns)}")
+        fetched = await fetch_locked(day)
+        if fetched is None:
+            ui.notify('Another day is still loading', type='warning')
+        elif fetched['errors']:
+            ui.notify(f'{day}: {len(fetched["changed"])} lists changed, failed: {", ".join(fetched["errors"])}',
+                      type='warning')
+        else:
+            ui.notify(f'{day}: {len(fetched["changed"])} lists changed, {len(fetched["unchanged"])} unchanged')
+    except Exception as e:
+        ui.notify(f'Error fetching data for {day}: {str(e)}', type='error')
+    finally:
+        status.dismiss()
 
-        df2 = pd.read_csv(CSV_FILENAME_ITSS)
-        print(f"Загружен файл: {CSV_FILENAME_ITSS}")
-        print(f"Строк: {len(df2)}, Столбцов: {len(df2.columns)}")
+@ui.page('/view/programs')
+def view_programs():
+    ui.label(f'📊 Конкурсные списки за {data}').classes('text-2xl font-bold')
+    ui.button('Back to Home', on_click=lambda: ui.open('/'))
 
-        df3 = pd.read_csv(CSV_FILENAME_IVT)
-        print(f"Загружен файл: {CSV_FILENAME_IVT}")
-        print(f"Строк: {len(df3)}, Столбцов: {len(df3.columns)}")
-    except Exception as e:
-        print(f"Ошибка загрузки файла: {e}")
-        df1 = pd.DataFrame()  # Пустой DataFrame если ошибка
-        df2 = pd.DataFrame()  # Пустой DataFrame если ошибка
-        df3 = pd.DataFrame()  # Пустой DataFrame если ошибка
-
-
-    # Создаем интерфейс
-    ui.label(f'📊 Просмотр списока: {CSV_FILENAME_IB}').classes('text-2xl font-bold')
-
-    
-    # Отображаем таблицу
-    if not df1.empty:
-        # Создаем таблицу с помощью ag-Grid (более мощная)
-        columns = [{'field': col, 'headerName': col, 'sortable': True, 'filter': True} for col in df1.columns]
-        rows = df1.to_dict('records')
-        
-        grid = ui.aggrid({
-            'columnDefs': columns,
-            'rowData': rows,
-            'pagination': True,
-            'paginationPageSize': 20,
-            'defaultColDef': {
-                'resizable': True,
-                'sortable': True,
-                'filter': True,
-                'floatingFilter': True,
-            }
-        }).classes('w-full h-96')
-        
-        # Кнопка для обновления
-        def refresh_data():
-            try:
-                new_df = pd.read_csv(CSV_FILENAME_IB)
-                grid.options['rowData'] = new_df.to_dict('records')
-                grid.update()
-                ui.notify('Данные обновлены!', type='positive')
-            except Exception as e:
-                ui.notify(f'Ошибка обновления: {e}', type='negative')
-        
-        #ui.button('🔄 Обновить данные', on_click=refresh_data).props('color=primary')
-        
-        # Предпросмотр данных в текстовом формате
-        #with ui.expansion('📝 Сырые данные (первые 10 строк)').classes('w-full mt-4'):
-            #ui.code(df1.head(10).to_string())
-    else:
-        ui.label('❌ Не удалось загрузить данные из CSV файла').classes('text-red text-lg')
-
-    ui.label(f'📊 Просмотр списока: {CSV_FILENAME_ITSS}').classes('text-2xl font-bold')
-
-    #Таблица 2
-    if not df2.empty:
-        # Создаем таблицу с помощью ag-Grid (более мощная)
-        columns = [{'field': col, 'headerName': col, 'sortable': True, 'filter': True} for col in df2.columns]
-        rows = df2.to_dict('records')
-        
-        grid = ui.aggrid({
+    names = {p['code']: p['name'] for p in REGISTRY}
+    # Факультеты и направления раскрываются по требованию: таблица создаётся при первом открытии
+    for faculty, ops in FACULTIES.items():
+        with ui.expansion(f'{faculty} ({len(ops)})', value=len(FACULTIES) == 1).classes('w-full'):
+            for op in ops:
+                title = op if names[op] == op else f'{op} — {names[op]}'
+                program = ui.expansion(f'📊 Просмотр списка: {title}', value=len(OPS) <= 4).classes('w-full')
+                program.on_value_change(lambda e, op=op, program=program: e.value and program_grid(program, op))
+                if program.value:
+                    program_grid(program, op)
+
+def program_grid(container, op):
+    if container.default_slot.children:
+        return
+    with container:
+        # Строки подгружаются блоками с сервера: сортировка и фильтры выполняются в SQL
+        columns = [{'field': col, 'headerName': col, 'filter': False if col == 'Consent' else 'agNumberColumnFilter'}
+                   for col in grid.PROGRAM_COLUMNS]
+        ui.aggrid({
             'columnDefs': columns,
-            'rowData': rows,
-            'pagination': True,
-            'paginationPageSize': 20,
+            'rowModelType': 'infinite',
+            'cacheBlockSize': 100,
+            'maxBlocksInCache': 10,
+            ':datasource': grid.datasource(f'/api/grid/program/{op}'),
             'defaultColDef': {
                 'resizable': True,
                 'sortable': True,
-                'filter': True,
                 'floatingFilter': True,
             }
         }).classes('w-full h-96')
-        
-        # Кнопка для обновления
-        def refresh_data():
-            try:
-                new_df = pd.read_csv(CSV_FILENAME_ITSS)
-                grid.options['rowData'] = new_df.to_dict('records')
-                grid.update()
-                ui.notify('Данные обновлены!', type='positive')
-            except Exception as e:
-                ui.notify(f'Ошибка обновления: {e}', type='negative')
-        
-        #ui.button('🔄 Обновить данные', on_click=refresh_data).props('color=primary')
-        
-        # Предпросмотр данных в текстовом формате
-        #with ui.expansion('📝 Сырые данные (первые 10 строк)').classes('w-full mt-4'):
-            #ui.code(df1.head(10).to_string())
-    else:
-        ui.label('❌ Не удалось загрузить данные из CSV файла').classes('text-red text-lg')
-
-    ui.label(f'📊 Просмотр списока: {CSV_FILENAME_IVT}').classes('text-2xl font-bold')
-
-    if not df3.empty:
-        # Создаем таблицу с помощью ag-Grid (более мощная)
-        columns = [{'field': col, 'headerName': col, 'sortable': True, 'filter': True} for col in df3.columns]
-        rows = df3.to_dict('records')
-        
-        grid = ui.aggrid({
-            'columnDefs': columns,
-            'rowData': rows,
-            'pagination': True,
-            'paginationPageSize': 20,
-            'defaultColDef': {
-                'resizable': True,
-                'sortable': True,
-                'filter': True,
-                'floatingFilter': True,
-            }
-        }).classes('w-full h-96')
-        
-        # Кнопка для обновления
-        def refresh_data():
-            try:
-                new_df = pd.read_csv(CSV_FILENAME_IVT)
-                grid.options['rowData'] = new_df.to_dict('records')
-                grid.update()
-                ui.notify('Данные обновлены!', type='positive')
-            except Exception as e:
-                ui.notify(f'Ошибка обновления: {e}', type='negative')
-        
-        #ui.button('🔄 Обновить данные', on_click=refresh_data).props('color=primary')
-        
-        # Предпросмотр данных в текстовом формате
-        #with ui.expansion('📝 Сырые данные (первые 10 строк)').classes('w-full mt-4'):
-            #ui.code(df1.head(10).to_string())
-    else:
-        ui.label('❌ Не удалось загрузить данные из CSV файла').classes('text-red text-lg')
+
+# Plain def handlers run in the worker thread pool, each with its own read-only session
+@app.post('/api/grid/program/{op}')
+def grid_program_block(op: str, params: dict):
+    try:
+        with metrics.stage('grid_block'), database.read_session() as session:
+            return grid.fetch_block(session, op, params)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post('/api/grid/overall')
+def grid_overall_block(params: dict):
+    try:
+        with metrics.stage('grid_block'), database.read_session() as session:
+            return grid.fetch_overall_block(session, OPS, params)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @ui.page('/view/overall')
-def view_overall():
-    if not db.query(Entrant).first():
-        load_day('01.08')
+async def view_overall():
+    global data
+    with database.read_session() as session:
+        empty = session.query(Entrant).first() is None
+    # The first day is loaded in a worker thread, other clients keep being served meanwhile
+    if empty and load_lock.acquire(blocking=False):
+        try:
+            await run.io_bound(load_day, '01.08')
+            data = '01.08'
+        finally:
+            load_lock.release()
 
     ui.label('Overall Competition List with Cascade Priorities').classes('text-h4')
     ui.button('Back to Home', on_click=lambda: ui.open('/'))
 
-    entrants = db.query(Entrant).all()
-    data = []
-    for entrant in entrants:
-        apps = {app.op: {'priority': app.priority, 'consent': app.consent} for app in entrant.applications}
-        row = {
-            'ID': entrant.id,
-            'Physics': entrant.phys,
-            'Russian': entrant.rus,
-            'Math': entrant.math,
-            'Individual': entrant.ind,
-            'Total': entrant.total,
-            'PM Priority': apps.get('PM', {}).get('priority', '-'),
-            'PM Consent': apps.get('PM', {}).get('consent', '-'),
-            'IVT Priority': apps.get('IVT', {}).get('priority', '-'),
-            'IVT Consent': apps.get('IVT', {}).get('consent', '-'),
-            'ITSS Priority': apps.get('ITSS', {}).get('priority', '-'),
-            'ITSS Consent': apps.get('ITSS', {}).get('consent', '-'),
-            'IB Priority': apps.get('IB', {}).get('priority', '-'),
-            'IB Consent': apps.get('IB', {}).get('consent', '-'),
+    # Only the visible block of the wide per-entrant table is fetched from the server
+    columns = [{'field': col, 'headerName': col, 'filter': False if col.endswith('Consent') else 'agNumberColumnFilter'}
+               for col in grid.overall_columns(OPS)]
+    ui.aggrid({
+        'columnDefs': columns,
+        'rowModelType': 'infinite',
+        'cacheBlockSize': 100,
+        'maxBlocksInCache': 10,
+        ':datasource': grid.datasource('/api/grid/overall'),
+        'defaultColDef': {
+            'resizable': True,
+            'sortable': True,
+            'floatingFilter': True,
         }
-        data.append(row)
-    ui.table.from_pandas(pd.DataFrame(data))
-
-def generate_pdf():
-    # Generate PDF
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt="Admission Report", ln=True, align='C')
-    pdf.cell(200, 10, txt="Date and Time: " + str(pd.Timestamp.now()), ln=True)
-    # Passing scores (latest for each OP)
-    pdf.cell(200, 10, txt="Passing Scores", ln=True)
-    ops = ['PM', 'IVT', 'ITSS', 'IB']
-    for op in ops:
-        latest_score = PassingScore.query.filter_by(op=op).order_by(PassingScore.day.desc()).first()
-        score_text = latest_score.score if latest_score else "N/A"
-        pdf.cell(200, 10, txt=f"{op}: {score_text}", ln=True)
-    # Dynamics graphs
-    import tempfile
-    import os
-    for op in ops:
-        scores = [(s.day, int(s.score) if s.score != "NEDOBOR" else 0) for s in PassingScore.query.filter_by(op=op).order_by(PassingScore.day).all()]
-        if scores:
-            days, vals = zip(*scores)
-            plt.figure()
-            plt.plot(days, vals)
-            plt.title(f"Passing Score Dynamics for {op}")
-            plt.xlabel("Day")
-            plt.ylabel("Score")
-            with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmp:
-                plt.savefig(tmp.name, format='png')
-                pdf.image(tmp.name, w=100)
-                os.unlink(tmp.name)
-            plt.close()
-    # Enrolled lists
-    pdf.add_page()
-    pdf.cell(200, 10, txt="Enrolled Applicants", ln=True)
-    spots = {'PM': 40, 'IVT': 50, 'ITSS': 30, 'IB': 20}
-    for op in ops:
-        pdf.cell(200, 10, txt=f"{op}", ln=True)
-        apps = Application.query.filter_by(op=op, consent=True).join(Entrant).order_by(Application.priority, Entrant.total.desc()).limit(spots[op]).all()
-        for app in apps:
-            pdf.cell(200, 10, txt=f"ID: {app.entrant.id}, Total: {app.entrant.total}", ln=True)
-    pdf.output("report.pdf")
-    
-@app.route('/report')
+    }).classes('w-full h-[80vh]')
+
+def describe_cutoff(score, previous=None):
+    text = 'NEDOBOR' if score is None else str(score)
+    if score is not None and previous is not None and score != previous:
+        text += f' ({score - previous:+d})'
+    return text
+
+@ui.page('/dashboard')
+def dashboard():
+    snap = current_snapshot()
+    state = {'version': snap.version}
+    ui.label('Live Dashboard').classes('text-h4')
+    ui.button('Back to Home', on_click=lambda: ui.open('/'))
+    version = ui.label(f'Data version {snap.version}, day {snap.day or data}')
+    cutoffs = {}
+    with ui.row():
+        for op in snap.ops:
+            with ui.card():
+                ui.label(op).classes('text-h6')
+                cutoffs[op] = ui.label(describe_cutoff(snap.cutoffs[op]))
+    # Admitted lists of all programs; rows are keyed so transactions can find them
+    table = ui.aggrid({
+        'columnDefs': [{'field': col, 'headerName': col.capitalize()} for col in live.COLUMNS],
+        'rowData': live.records(live.rows(snap)),
+        ':getRowId': '(params) => params.data.key',
+        'defaultColDef': {'resizable': True, 'sortable': True, 'filter': True},
+    }).classes('w-full h-[70vh]')
+
+    def apply(change):
+        if change['version'] <= state['version']:
+            return
+        if change['from'] == state['version']:
+            table.run_grid_method('applyTransaction', change['transaction'])
+        else:
+            # A version was missed (e.g. the page was built during a publish): send the whole list once
+            latest = snapshot.current()
+            table.run_grid_method('setGridOption', 'rowData', live.records(live.rows(latest)))
+            change = dict(change, version=latest.version, day=latest.day, cutoffs=latest.cutoffs)
+        state['version'] = change['version']
+        version.text = f'Data version {change["version"]}, day {change["day"]}'
+        for op, label in cutoffs.items():
+            label.text = describe_cutoff(change['cutoffs'][op], change['previous_cutoffs'].get(op))
+
+    data_published.subscribe(apply)
+
+def analytics_rows(snap, points):
+    rows = []
+    for op in snap.ops:
+        summary = snap.scores.summary(op, points)
+        near = summary['near_cutoff'] or {}
+        percentile = summary['cutoff_percentile']
+        rows.append({
+            'op': op,
+            'applicants': summary['applicants'],
+            'consented': summary['consented'],
+            'cutoff': describe_cutoff(summary['cutoff']),
+            'percentile': '' if percentile is None else f'{percentile:.1f}',
+            'below': near.get('below', ''),
+            'above': near.get('at_or_above', ''),
+            **{f'priority{i + 1}': count for i, count in enumerate(summary['by_priority'])},
+        })
+    return rows
+
+def band_chart(snap, op, width):
+    # Stacked score bands of one program, one series per priority
+    bands = snap.scores.bands(op, width)
+    names = [f'Priority {i + 1}' for i in range(distribution.PRIORITY_GROUPS)]
+    names[-1] += '+'
+    return {
+        'tooltip': {'trigger': 'axis'},
+        'legend': {'data': names},
+        'xAxis': {'type': 'category', 'data': [f'{b["start"]}-{b["end"]}' for b in bands]},
+        'yAxis': {'type': 'value'},
+        'series': [{'name': name, 'type': 'bar', 'stack': 'applicants', 'data': [b['by_priority'][i] for b in bands]}
+                   for i, name in enumerate(names)],
+    }
+
+@ui.page('/analytics')
+def analytics():
+    # Everything here comes from the snapshot's prefix sums, the application table is not read
+    ui.label('Score Analytics').classes('text-h4')
+    ui.button('Back to Home', on_click=lambda: ui.open('/'))
+    version = ui.label()
+    with ui.row():
+        points = ui.number('Points around the cutoff', value=5, min=1, max=50, format='%d')
+        width = ui.number('Score band width', value=10, min=1, max=100, format='%d')
+    last = f'Priority {distribution.PRIORITY_GROUPS}+'
+    columns = [
+        {'name': 'op', 'label': 'Program', 'field': 'op', 'align': 'left'},
+        {'name': 'applicants', 'label': 'Applicants', 'field': 'applicants'},
+        {'name': 'consented', 'label': 'Consented', 'field': 'consented'},
+        {'name': 'cutoff', 'label': 'Cutoff', 'field': 'cutoff'},
+        {'name': 'percentile', 'label': 'Cutoff percentile', 'field': 'percentile'},
+        {'name': 'below', 'label': 'Consented just below', 'field': 'below'},
+        {'name': 'above', 'label': 'Consented at or just above', 'field': 'above'},
+    ] + [{'name': f'priority{i + 1}', 'field': f'priority{i + 1}',
+          'label': last if i + 1 == distribution.PRIORITY_GROUPS else f'Priority {i + 1}'}
+         for i in range(distribution.PRIORITY_GROUPS)]
+    table = ui.table(columns=columns, rows=[], row_key='op').classes('w-full')
+    program = ui.select(OPS, value=OPS[0], label='Program')
+    chart = ui.echart({}).classes('w-full h-96')
+
+    def refresh():
+        snap = current_snapshot()
+        version.text = f'Data version {snap.version}, day {snap.day or data}'
+        table.rows = analytics_rows(snap, int(points.value or 5))
+        chart.options.clear()
+        chart.options.update(band_chart(snap, program.value or OPS[0], int(width.value or 10)))
+        chart.update()
+
+    points.on_value_change(refresh)
+    width.on_value_change(refresh)
+    program.on_value_change(refresh)
+    data_published.subscribe(lambda change: refresh())
+    refresh()
+
+def generate_pdf(profile=None):
+    # Rendered once per data version, charts in parallel, entirely in memory
+    with metrics.capture('report', profile), database.read_session() as session:
+        snap = snapshot.get(session, OPS, SPOTS)
+        return pdf_report.get_report(session, snap, FACULTIES)
+
+def current_snapshot():
+    with database.read_session() as session:
+        return snapshot.get(session, OPS, SPOTS)
+
+@app.get('/report')
+async def report_download(profile: bool = False):
+    # ?profile=true captures this request even while profiling is off
+    pdf = await run.io_bound(generate_pdf, profile or None)
+    return Response(content=pdf, media_type='application/pdf',
+                    headers={'Content-Disposition': 'attachment; filename="report.pdf"'})
+
+@app.get('/api/programs')
+def program_registry():
+    # Programs with seats, grouped by faculty
+    by_code = {p['code']: p for p in REGISTRY}
+    return [{'faculty': faculty, 'programs': [by_code[op] for op in ops]} for faculty, ops in FACULTIES.items()]
+
+@app.get('/api/days')
+def stored_days():
+    return daystore.days()
+
+@app.get('/api/quarantine/{day}')
+def quarantined_rows(day: str):
+    # Rows of the day's lists that failed validation, with the reasons
+    with database.read_session() as session:
+        return validate.rows(session, day)
+
+@app.get('/api/days/{before}/{after}')
+def compare_days(before: str, after: str):
+    # Day-to-day changes, read from the stored day files
+    stored = daystore.days()
+    for day in (before, after):
+        if day not in stored:
+            raise HTTPException(status_code=404, detail=f'Day {day} is not loaded')
+    return daystore.compare(before, after)
+
+@app.get('/api/programs/{op}/admitted/{day}')
+def admitted_on(op: str, day: str):
+    # Point-in-time admitted list of a program
+    if op not in OPS:
+        raise HTTPException(status_code=404, detail=f'Program {op} not found')
+    try:
+        with database.read_session() as session:
+            return history.admitted_on(session, op, day)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get('/api/programs/{op}/admitted/{before}/{after}')
+def admitted_diff(op: str, before: str, after: str):
+    if op not in OPS:
+        raise HTTPException(status_code=404, detail=f'Program {op} not found')
+    try:
+        with database.read_session() as session:
+            return history.diff(session, op, before, after)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.get('/api/entrants/{entrant_id}')
+async def entrant_lookup(entrant_id: int):
+    # Rank, margin to the cutoff and admission outcome from the current snapshot
+    result = current_snapshot().index.lookup(entrant_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f'Entrant {entrant_id} not found')
+    return result
+
+@app.get('/api/entrants/{entrant_id}/history')
+def entrant_history(entrant_id: int):
+    with database.read_session() as session:
+        return history.entrant(session, entrant_id)
+
+@app.post('/api/scenarios')
+async def run_scenarios(params: dict):
+    # {"scenarios": [{"name": "IB +10", "seats": {"IB": 10}, "consent": 0.2}, ...], "runs": 200, "seed": 0}
+    runs = int(params.get('runs', 100))
+    if not 1 <= runs <= 10000:
+        raise HTTPException(status_code=400, detail='runs must be between 1 and 10000')
+    arrays = current_snapshot().arrays()
+    try:
+        return await run.io_bound(scenarios.run, arrays, SPOTS, params.get('scenarios') or [{}], runs,
+                                  int(params.get('seed', 0)))
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post('/api/sources/{day}')
+async def fetch_sources(day: str):
+    # Polls the day's lists now; 409 while another load runs
+    if not SOURCE_URL:
+        raise HTTPException(status_code=404, detail='SOURCE_URL is not set')
+    try:
+        fetched = await fetch_locked(day)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if fetched is None:
+        raise HTTPException(status_code=409, detail='Another day is still loading')
+    return {key: value for key, value in fetched.items() if key != 'entries'}
+
+@app.get('/api/analytics')
+def score_analytics(points: int = 5, width: int = 10):
+    # Per-program score bands, priority split and consented applicants near the cutoff
+    if not 1 <= width <= distribution.MAX_TOTAL or points < 0:
+        raise HTTPException(status_code=400, detail=f'width must be 1..{distribution.MAX_TOTAL}, points >= 0')
+    snap = current_snapshot()
+    return {'version': snap.version, 'day': snap.day,
+            'programs': [snap.scores.summary(op, points, width) for op in snap.ops]}
+
+@app.get('/api/analytics/{op}/count')
+def score_band(op: str, low: int = 0, high: int = distribution.MAX_TOTAL, consent: bool | None = None,
+               priority: int | None = None):
+    # Applicants with low <= total <= high, optionally by consent and priority
+    scores = current_snapshot().scores
+    if op not in scores.below:
+        raise HTTPException(status_code=404, detail=f'Program {op} not found')
+    return {'op': op, 'low': low, 'high': high, 'count': scores.count(op, low, high, consent, priority)}
+
+@app.get('/api/analytics/{op}/percentile/{total}')
+def score_percentile(op: str, total: int, consent: bool | None = None):
+    scores = current_snapshot().scores
+    if op not in scores.below:
+        raise HTTPException(status_code=404, detail=f'Program {op} not found')
+    return {'op': op, 'total': total, 'percentile': scores.percentile(op, total, consent)}
+
+@app.get('/metrics')
+def prometheus_metrics():
+    return Response(content=metrics.render(), media_type='text/plain; version=0.0.4')
+
+@app.get('/api/profiling')
+def profiling_captures():
+    # Latest captures: cProfile summary (cumulative time) and the SQL issued
+    return {'enabled': metrics.profiling, 'captures': list(metrics.captures)}
+
+@app.post('/api/profiling')
+def toggle_profiling(params: dict):
+    metrics.profiling = bool(params.get('enabled'))
+    return {'enabled': metrics.profiling}
+
 def generate_report():
-    generate_pdf()
-    ui.download('report.pdf')
+    ui.download.from_url('/report', 'report.pdf')
 
 if __name__ in {"__main__", "__mp_main__"}:
     ui.run()
@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import generate_data  # noqa: E402
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+PROGRAMS = generate_data.OPs
+OVERLAP = [0.4, 0.3, 0.2, 0.1]
+
+
+class Timer:
+    def __init__(self):
+        self.results = {}
+
+    def __call__(self, name, func, *args, **kwargs):
+        start = time.perf_counter()
+        value = func(*args, **kwargs)
+        self.results[name] = round(time.perf_counter() - start, 6)
+        print(f'  {name:<24} {self.results[name]:9.3f}s', flush=True)
+        return value
+
+
+def bench_size(applications, seed, workdir):
+    # One synthetic single-day campaign with about `applications` rows
+    import allocation
+    import churn
+    import daystore
+    import grid
+    import ingest
+    import pdf_report
+    import queries
+    import snapshot
+    import app_NEW  # noqa: F401  models and database.init
+    import database
+
+    mean_k = sum((k + 1) * p for k, p in enumerate(OVERLAP))
+    entrants = max(int(applications / mean_k), 1)
+    spots = {op: max(20, entrants // (10 * len(PROGRAMS))) for op in PROGRAMS}
+    data = tempfile.mkdtemp(dir=workdir)
+    timer = Timer()
+
+    df = timer('generate', lambda: next(generate_data.synthetic_campaign(
+        entrants, PROGRAMS, OVERLAP, 0.0, 1, seed)))
+    timer('write_csv', generate_data.write_day, data, '01.08', PROGRAMS, df)
+
+    session = database.Session()
+    try:
+        for table in ('application', 'entrant', 'passing_score'):
+            session.connection().exec_driver_sql(f'DELETE FROM {table}')
+        session.commit()
+        stats = timer('ingest', ingest.load_csvs, session, '01.08', PROGRAMS,
+                      os.path.join(data, '{day}_{op}.csv'))
+        timer('commit', session.commit)
+        arrays = timer('load_arrays', allocation.load_arrays, session)
+        result = timer('allocate', allocation.allocate, **arrays, spots=spots)
+        state = allocation.IncrementalAllocation(spots)
+        timer('incremental_reset', state.reset, arrays)
+        changed = arrays['entrant_id'][:max(len(arrays['entrant_id']) // 100, 1)]
+        timer('incremental_update_1pct', state.update, changed, allocation.load_arrays(session, changed))
+        # The views are built from the applications frame, as the snapshot does
+        frame = timer('applications_frame', queries.applications_frame, session)
+        timer('view_overall_frame', queries.pivot_overall, frame, PROGRAMS)
+        timer('view_program_frames', queries.split_programs, frame, PROGRAMS)
+        block = {'startRow': 0, 'endRow': 100, 'sortModel': [{'colId': 'Math', 'sort': 'desc'}],
+                 'filterModel': {'Total': {'filterType': 'number', 'type': 'greaterThan', 'filter': 150}}}
+        timer('grid_program_block', grid.fetch_block, session, PROGRAMS[0], block)
+        timer('grid_overall_block', grid.fetch_overall_block, session, PROGRAMS, block)
+        snap = timer('snapshot_build', snapshot.build, session, PROGRAMS, spots, '01.08', result)
+        timer('lookup_1000', lambda: [snap.index.lookup(i) for i in snap.overall['ID'].to_numpy()[:1000].tolist()])
+        timer('day_write', daystore.write, '01.08', frame, result['cutoffs'])
+        timer('day_read', daystore.frame, '01.08')
+        timer('snapshot_from_day', snapshot.load, '01.08', PROGRAMS, spots)
+        history = {op: [(day, result['cutoffs'][op]) for day in generate_data.Days] for op in PROGRAMS}
+        pdf = timer('report', pdf_report.build_pdf, snap, history)
+        timer('churn', churn.simulate, session, churn.make_rng(seed))
+    finally:
+        session.close()
+    return {
+        'applications': stats['rows'],
+        'entrants': stats['entrants'],
+        'rows_per_sec': round(stats['rows_per_sec']),
+        'report_bytes': len(pdf),
+        'seconds': timer.results,
+    }
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f'\nCompared with {baseline_path} (ratio > 1 is slower now)')
+    for size, entry in current['results'].items():
+        old = baseline['results'].get(size)
+        if not old:
+            continue
+        print(f'{size} applications')
+        for stage, seconds in entry['seconds'].items():
+            before = old['seconds'].get(stage)
+            if before:
+                print(f'  {stage:<24} {before:9.3f}s -> {seconds:9.3f}s  x{seconds / before:.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time ingest, allocation, views and report on synthetic campaigns')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in SIZES), help='application counts')
+    parser.add_argument('--seed', type=int, default=2024)
+    parser.add_argument('--output', help='JSON results file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='dqtq-bench-')
+    # app_NEW creates its admission.db in the working directory
+    os.chdir(workdir)
+    results = {}
+    for size in [int(s) for s in args.sizes.split(',')]:
+        print(f'{size} applications', flush=True)
+        results[str(size)] = bench_size(size, args.seed, workdir)
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'results': results,
+    }
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results',
+                                         datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResults written to {output}')
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import json
+import os
+import numpy as np
+
+# Between two days some entrants withdraw, others get rechecked scores or change their consent.
+# CHURN_SEED makes the sequence of days reproducible, e.g. for benchmarks.
+DELETE_SHARE = (0.05, 0.10)
+UPDATE_SHARE = 0.2
+CONSENT_FLIP = 0.1
+
+
+def make_rng(seed=None):
+    if seed is None and os.environ.get('CHURN_SEED'):
+        seed = int(os.environ['CHURN_SEED'])
+    return np.random.default_rng(seed)
+
+
+def _ids(conn, sql, params=()):
+    return np.fromiter((row[0] for row in conn.exec_driver_sql(sql, params)), dtype=np.int64)
+
+
+def simulate(session, rng):
+    # Sample the churn with NumPy and apply it with a few set-based statements.
+    # Returns the deleted and updated entrant ids.
+    conn = session.connection()
+    ids = _ids(conn, 'SELECT id FROM entrant ORDER BY id')
+    if not len(ids):
+        return set(), set()
+    low, high = (int(share * len(ids)) for share in DELETE_SHARE)
+    deleted = rng.choice(ids, int(rng.integers(low, high, endpoint=True)), replace=False)
+    remaining = np.setdiff1d(ids, deleted, assume_unique=True)
+    updated = remaining[rng.random(len(remaining)) < UPDATE_SHARE]
+
+    conn.exec_driver_sql('DELETE FROM application WHERE entrant_id IN (SELECT value FROM json_each(?))',
+                         (json.dumps(deleted.tolist()),))
+    conn.exec_driver_sql('DELETE FROM entrant WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(deleted.tolist()),))
+
+    if len(updated):
+        deltas = np.column_stack([
+            rng.integers(-5, 5, size=(len(updated), 3), endpoint=True),
+            rng.integers(-2, 2, size=len(updated), endpoint=True),
+            updated,
+        ])
+        # SET expressions all see the old row, so total repeats the clamped sums
+        new = [f'MAX(0, {col} + d.value ->> {i})' for i, col in enumerate(['phys', 'rus', 'math', 'ind'])]
+        conn.exec_driver_sql(f'UPDATE entrant SET phys = {new[0]}, rus = {new[1]}, math = {new[2]}, ind = {new[3]}, '
+                             f'total = {" + ".join(new)} FROM json_each(?) d WHERE entrant.id = d.value ->> 4',
+                             (json.dumps(deltas.tolist()),))
+        apps = _ids(conn, 'SELECT id FROM application WHERE entrant_id IN (SELECT value FROM json_each(?)) ORDER BY id',
+                    (json.dumps(updated.tolist()),))
+        flipped = apps[rng.random(len(apps)) < CONSENT_FLIP]
+        conn.exec_driver_sql('UPDATE application SET consent = NOT consent '
+                             'WHERE id IN (SELECT value FROM json_each(?))', (json.dumps(flipped.tolist()),))
+    # ORM objects loaded before the churn are stale now
+    session.expire_all()
+    return set(deleted.tolist()), set(updated.tolist())
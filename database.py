@@ -0,0 +1,69 @@
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# WAL lets readers keep working on the last committed state while a load writes,
+# and synchronous=NORMAL is durable enough with WAL while saving an fsync per commit.
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -65536,  # in KiB: 64 MB page cache per connection
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+    'foreign_keys': 'ON',
+    'busy_timeout': 5000,
+}
+
+engine = None  # pooled connections for loads and other writes
+read_engine = None  # query_only connections for views and APIs
+Session = None
+ReadSession = None
+
+
+def set_pragmas(dbapi_connection, readonly=False):
+    cursor = dbapi_connection.cursor()
+    for name, value in PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+    if readonly:
+        cursor.execute('PRAGMA query_only = ON')
+    cursor.close()
+
+
+def make_engine(url, readonly=False, pool_size=5):
+    # Pooled connections are handed between threads, one thread at a time
+    engine = create_engine(url, pool_size=pool_size, max_overflow=10, connect_args={'check_same_thread': False})
+    event.listen(engine, 'connect', lambda dbapi_connection, record: set_pragmas(dbapi_connection, readonly))
+    return engine
+
+
+def init(url):
+    global engine, read_engine, Session, ReadSession
+    engine = make_engine(url)
+    read_engine = make_engine(url, readonly=True, pool_size=10)
+    Session = sessionmaker(bind=engine, autoflush=False)
+    ReadSession = sessionmaker(bind=read_engine, autoflush=False)
+    return engine
+
+
+@contextmanager
+def session_scope():
+    # One session per request or task: committed on success, rolled back on error,
+    # so a failure never leaves a broken transaction behind for other users
+    session = Session()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+@contextmanager
+def read_session():
+    session = ReadSession()
+    try:
+        yield session
+    finally:
+        session.close()
@@ -0,0 +1,108 @@
+import json
+import os
+import re
+import pyarrow as pa
+
+# Every loaded day is kept as one immutable Arrow IPC file: the applications frame
+# (queries.applications_frame) with the day's cutoffs in the schema metadata.
+# Files are read back through a memory map, so numeric columns are not copied.
+DIRECTORY = 'days'
+# Days are named DD.MM, like the list files
+DAY = re.compile(r'\d\d\.\d\d')
+
+
+def _path(day, directory):
+    return os.path.join(directory, f'{day}.arrow')
+
+
+def check_day(day):
+    # Called before a day touches the database or the disk
+    if not DAY.fullmatch(day):
+        raise ValueError(f'Bad day: {day!r}, expected DD.MM')
+    return day
+
+
+def _order(day):
+    # '02.08' -> (8, 2), so days sort by date within the campaign
+    return tuple(int(part) for part in reversed(day.split('.')))
+
+
+def write(day, frame, cutoffs, directory=DIRECTORY):
+    # Written to a temporary file and renamed, readers never see a partial day
+    check_day(day)
+    os.makedirs(directory, exist_ok=True)
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    table = table.replace_schema_metadata({
+        'day': day,
+        'cutoffs': json.dumps({op: None if score is None else int(score) for op, score in cutoffs.items()}),
+    })
+    path = _path(day, directory)
+    with pa.OSFile(path + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def read(day, directory=DIRECTORY):
+    # Arrow table backed by the memory-mapped file
+    return pa.ipc.open_file(pa.memory_map(_path(day, directory))).read_all()
+
+
+def frame(day, directory=DIRECTORY):
+    return read(day, directory).to_pandas(split_blocks=True)
+
+
+def cutoffs(day, directory=DIRECTORY):
+    # Only the footer and schema are read, not the data
+    schema = pa.ipc.open_file(pa.memory_map(_path(day, directory))).schema
+    return json.loads(schema.metadata[b'cutoffs'])
+
+
+def days(directory=DIRECTORY):
+    if not os.path.isdir(directory):
+        return []
+    # Files not named like a day are not ours and are skipped
+    names = [name[:-len('.arrow')] for name in os.listdir(directory) if name.endswith('.arrow')]
+    return sorted((name for name in names if DAY.fullmatch(name)), key=_order)
+
+
+def history(ops, directory=DIRECTORY):
+    # Passing score dynamics of every program, one point per stored day
+    result = {op: [] for op in ops}
+    for day in days(directory):
+        scores = cutoffs(day, directory)
+        for op in ops:
+            if op in scores:
+                result[op].append((day, scores[op]))
+    return result
+
+
+def clear(directory=DIRECTORY):
+    for day in days(directory):
+        os.remove(_path(day, directory))
+
+
+def compare(before, after, directory=DIRECTORY):
+    # What changed between two stored days: entrants added, removed and changed
+    # (scores or any application), plus the cutoff of every program on both days
+    old = frame(before, directory)
+    new = frame(after, directory)
+    keys = ['id', 'op']
+    merged = old.merge(new, on=keys, how='outer', suffixes=('_old', '_new'), indicator=True)
+    fields = [column for column in old.columns if column not in keys]
+    differs = merged['_merge'] != 'both'
+    for field in fields:
+        differs |= merged[f'{field}_old'] != merged[f'{field}_new']
+    old_ids = set(old['id'].tolist())
+    new_ids = set(new['id'].tolist())
+    changed = set(merged.loc[differs, 'id'].tolist()) & old_ids & new_ids
+    old_cutoffs = cutoffs(before, directory)
+    new_cutoffs = cutoffs(after, directory)
+    return {
+        'added': sorted(new_ids - old_ids),
+        'removed': sorted(old_ids - new_ids),
+        'changed': sorted(changed),
+        'cutoffs': {op: [old_cutoffs.get(op), new_cutoffs.get(op)] for op in sorted(set(old_cutoffs) | set(new_cutoffs))},
+    }
+
@@ -0,0 +1,90 @@
+import numpy as np
+
+# Score distribution of every program, built once per snapshot: applicant counts
+# per total score, split by consent and priority, kept as prefix sums along the
+# score axis. Any score band, percentile rank or count near the cutoff is then a
+# difference of two prefix values per cell, whatever the size of the lists.
+MAX_TOTAL = 310
+# Priorities 1, 2, 3 and 4 or lower
+PRIORITY_GROUPS = 4
+
+
+class ScoreDistribution:
+    def __init__(self, snap):
+        self.ops = list(snap.ops)
+        self.cutoffs = dict(snap.cutoffs)
+        # op -> [consent, priority group, s]: applicants with a total below s
+        self.below = {}
+        cells = 2 * PRIORITY_GROUPS * (MAX_TOTAL + 1)
+        for op in self.ops:
+            frame = snap.programs[op]
+            totals = np.clip(frame['total'].to_numpy(dtype=np.int64), 0, MAX_TOTAL)
+            groups = np.clip(frame['priority'].to_numpy(dtype=np.int64), 1, PRIORITY_GROUPS) - 1
+            consent = frame['consent'].to_numpy(dtype=bool).astype(np.int64)
+            cell = (consent * PRIORITY_GROUPS + groups) * (MAX_TOTAL + 1) + totals
+            counts = np.bincount(cell, minlength=cells).reshape(2, PRIORITY_GROUPS, MAX_TOTAL + 1)
+            below = np.zeros((2, PRIORITY_GROUPS, MAX_TOTAL + 2), dtype=np.int64)
+            np.cumsum(counts, axis=2, out=below[:, :, 1:])
+            self.below[op] = below
+
+    def _cells(self, op, consent=None, priority=None):
+        below = self.below[op]
+        if consent is not None:
+            below = below[[int(bool(consent))]]
+        if priority is not None:
+            group = min(max(int(priority), 1), PRIORITY_GROUPS) - 1
+            below = below[:, [group]]
+        return below
+
+    def count(self, op, low=0, high=MAX_TOTAL, consent=None, priority=None):
+        # Applicants with low <= total <= high; priority PRIORITY_GROUPS means that one or lower
+        low = min(max(int(low), 0), MAX_TOTAL + 1)
+        high = min(max(int(high), low - 1), MAX_TOTAL)
+        below = self._cells(op, consent, priority)
+        return int((below[:, :, high + 1] - below[:, :, low]).sum())
+
+    def percentile(self, op, total, consent=None):
+        # Share of the program's applicants ranked below the score, ties counted half
+        below = self._cells(op, consent)
+        total = min(max(int(total), 0), MAX_TOTAL)
+        size = int(below[:, :, -1].sum())
+        if not size:
+            return None
+        lower = int(below[:, :, total].sum())
+        equal = int(below[:, :, total + 1].sum()) - lower
+        return 100.0 * (lower + equal / 2) / size
+
+    def near_cutoff(self, op, points=5):
+        # Consented applicants within points of the cutoff, on either side of it
+        cutoff = self.cutoffs[op]
+        if cutoff is None:
+            return None
+        return {
+            'below': self.count(op, cutoff - points, cutoff - 1, consent=True),
+            'at_or_above': self.count(op, cutoff, cutoff + points, consent=True),
+        }
+
+    def bands(self, op, width=10):
+        # Applicants per score band [start, start + width), by consent and priority
+        edges = np.minimum(np.arange(0, MAX_TOTAL + width + 1, width), MAX_TOTAL + 1)
+        counts = np.diff(self.below[op][:, :, edges], axis=2)
+        return [{
+            'start': int(edges[i]),
+            'end': int(edges[i + 1]) - 1,
+            'applicants': int(counts[:, :, i].sum()),
+            'consented': int(counts[1, :, i].sum()),
+            'by_priority': counts[:, :, i].sum(axis=0).tolist(),
+        } for i in range(len(edges) - 1) if edges[i] <= MAX_TOTAL]
+
+    def summary(self, op, points=5, width=10):
+        cutoff = self.cutoffs[op]
+        return {
+            'op': op,
+            'applicants': self.count(op),
+            'consented': self.count(op, consent=True),
+            'by_priority': self.below[op][:, :, -1].sum(axis=0).tolist(),
+            'cutoff': cutoff,
+            'cutoff_percentile': None if cutoff is None else self.percentile(op, cutoff),
+            'near_cutoff': self.near_cutoff(op, points),
+            'bands': self.bands(op, width),
+        }
@@ -1,8 +1,14 @@
-import csv
+import argparse
+import json
+import os
 import random
 from itertools import combinations
+import numpy as np
+import pandas as pd
+import seats
 
 #Эта штука генерирует списки что бы вручную не пришлось
+#Без аргументов - фиксированные 4 дня, с --entrants - синтетическая кампания любого размера
 
 OPs = ['PM', 'IVT', 'ITSS', 'IB'] #Названия направлений
 Days = ['01.08', '02.08', '03.08', '04.08'] #дни
@@ -39,7 +45,15 @@ quad_data = {
 }
 
 
-for day in Days:
+#Заголовки CSV: load_day читает английские, старые файлы были с русскими
+HEADERS = {
+    'en': ['ID', 'Consent', 'Priority', 'Physics', 'Russian', 'Math', 'Individual', 'Total'],
+    'ru': ['ID', 'Согласие', 'Приоритет', 'Физика/ИКТ', 'Русский язык', 'Математика', 'ИД', 'Всего'],
+}
+SPOTS = seats.load()
+
+
+def fixed_day(day, rng):
     given = {}
     for pair, count in pair_data[day].items():
         given[frozenset(pair)] = count
@@ -69,58 +83,158 @@ for day in Days:
             continue
         op_list = list(S)
         for _ in range(num):
-            phys = random.randint(0, 100)
-            rus = random.randint(0, 100)
-            math = random.randint(0, 100)
-            ind = random.randint(0, 10)
-            total = phys + rus + math + ind
-            consent = random.choice([True, False])
-            priorities = random.sample(range(1, len(op_list) + 1), len(op_list))
-            entrant = {
+            phys = rng.randint(0, 100)
+            rus = rng.randint(0, 100)
+            math = rng.randint(0, 100)
+            ind = rng.randint(0, 10)
+            consent = rng.choice([True, False])
+            priorities = rng.sample(range(1, len(op_list) + 1), len(op_list))
+            entrants.append({
                 'id': entrant_id,
-                'Согласие': consent,
-                'Физика/ИКТ': phys,
-                'Русский язык': rus,
-                'Математика': math,
-                'ИД': ind,
-                'Всего': total,
-                'Приоритет': {op: pri for op, pri in zip(op_list, priorities)}
-            }
-            entrants.append(entrant)
+                'consent': consent,
+                'phys': phys,
+                'rus': rus,
+                'math': math,
+                'ind': ind,
+                'priority': {op: pri for op, pri in zip(op_list, priorities)}
+            })
             entrant_id += 1
 
     # For day 04.08, ensure enough consents
     if day == '04.08':
-        spots = {'PM': 40, 'IVT': 50, 'ITSS': 30, 'IB': 20}
         for op in OPs:
-            consented = [e for e in entrants if op in e['Приоритет'] and e['Согласие']]
-            if len(consented) <= spots[op]:
+            consented = [e for e in entrants if op in e['priority'] and e['consent']]
+            if len(consented) <= SPOTS[op]:
                 # Make more True
-                non_consented = [e for e in entrants if op in e['Приоритет'] and not e['Согласие']]
-                num_to_change = spots[op] + 1 - len(consented)
+                non_consented = [e for e in entrants if op in e['priority'] and not e['consent']]
+                num_to_change = SPOTS[op] + 1 - len(consented)
                 if num_to_change > 0 and non_consented:
-                    to_change = random.sample(non_consented, min(num_to_change, len(non_consented)))
+                    to_change = rng.sample(non_consented, min(num_to_change, len(non_consented)))
                     for e in to_change:
-                        e['Согласие'] = True
-
-    # Write CSVs
-    for op in OPs:
-        filename = f'{day}_{op}.csv'
-        with open(filename, 'w', newline='') as csvfile:
-            fieldnames = ['ID', 'Согласие', 'Приоритет', 'Физика/ИКТ', 'Русский язык', 'Математика', 'ИД', 'Всего']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            for entrant in entrants:
-                if op in entrant['Приоритет']:
-                    writer.writerow({
-                        'ID': entrant['id'],
-                        'Согласие': entrant['Согласие'],
-                        'Приоритет': entrant['Приоритет'][op],
-                        'Физика/ИКТ': entrant['Физика/ИКТ'],
-                        'Русский язык': entrant['Русский язык'],
-                        'Математика': entrant['Математика'],
-                        'ИД': entrant['ИД'],
-                        'Всего': entrant['Всего']
-                    })
-
-#generate data
+                        e['consent'] = True
+
+    # Long format: one row per application
+    rows = [(e['id'], op, pri, e['consent'], e['phys'], e['rus'], e['math'], e['ind'])
+            for e in entrants for op, pri in e['priority'].items()]
+    df = pd.DataFrame(rows, columns=['id', 'op', 'priority', 'consent', 'phys', 'rus', 'math', 'ind'])
+    df['total'] = df['phys'] + df['rus'] + df['math'] + df['ind']
+    return df
+
+
+def _new_entrants(rng, first_id, count, programs, overlap):
+    # Each entrant applies to k programs with probability overlap[k-1], priorities in random order
+    ids = np.arange(first_id, first_id + count)
+    k = rng.choice(np.arange(1, len(overlap) + 1), size=count, p=overlap)
+    scores = {
+        'phys': rng.integers(0, 101, count),
+        'rus': rng.integers(0, 101, count),
+        'math': rng.integers(0, 101, count),
+        'ind': rng.integers(0, 11, count),
+        'consent': rng.random(count) < 0.5,
+    }
+    # Random program order per entrant; the first k columns are their choices by priority
+    order = np.argsort(rng.random((count, len(programs))), axis=1)
+    rank = np.arange(len(programs))
+    mask = rank[None, :] < k[:, None]
+    rows, cols = np.nonzero(mask)
+    df = pd.DataFrame({
+        'id': ids[rows],
+        'op': np.asarray(programs)[order[rows, cols]],
+        'priority': cols + 1,
+        **{name: values[rows] for name, values in scores.items()},
+    })
+    df['total'] = df['phys'] + df['rus'] + df['math'] + df['ind']
+    return df
+
+
+def synthetic_campaign(entrants, programs, overlap, churn, days, seed):
+    # Yields one long DataFrame per day. The campaign grows linearly to `entrants`;
+    # between days `churn` of the entrants leave and another `churn` get new scores/consent.
+    rng = np.random.default_rng(seed)
+    overlap = np.asarray(overlap[:len(programs)], dtype=float)
+    overlap = overlap / overlap.sum()
+    df = None
+    next_id = 1
+    for day in range(days):
+        if df is not None:
+            ids = df['id'].unique()
+            leaving = rng.choice(ids, int(churn * len(ids)), replace=False)
+            df = df[~df['id'].isin(leaving)].copy()
+            ids = df['id'].unique()
+            changed = rng.choice(ids, int(churn * len(ids)), replace=False)
+            delta = pd.Series(rng.integers(-5, 6, len(changed)), index=changed)
+            hit = df['id'].isin(changed)
+            df.loc[hit, 'math'] = (df.loc[hit, 'math'] + df.loc[hit, 'id'].map(delta)).clip(0, 100)
+            df.loc[hit, 'consent'] = ~df.loc[hit, 'consent'].astype(bool)
+            df['total'] = df['phys'] + df['rus'] + df['math'] + df['ind']
+        present = 0 if df is None else df['id'].nunique()
+        count = max(round(entrants * (day + 1) / days) - present, 0)
+        arrivals = _new_entrants(rng, next_id, count, programs, overlap)
+        df = arrivals if df is None else pd.concat([df, arrivals], ignore_index=True)
+        next_id += count
+        yield df
+
+
+def write_day(out, day, programs, df, headers='en'):
+    names = HEADERS[headers]
+    groups = dict(tuple(df.groupby('op', sort=False)))
+    for op in programs:
+        rows = groups.get(op, df.iloc[0:0])
+        table = pd.DataFrame({
+            names[0]: rows['id'].to_numpy(),
+            names[1]: rows['consent'].astype(bool).to_numpy(),
+            names[2]: rows['priority'].to_numpy(),
+            names[3]: rows['phys'].to_numpy(),
+            names[4]: rows['rus'].to_numpy(),
+            names[5]: rows['math'].to_numpy(),
+            names[6]: rows['ind'].to_numpy(),
+            names[7]: rows['total'].to_numpy(),
+        }).sort_values(names[0])
+        table.to_csv(os.path.join(out, f'{day}_{op}.csv'), index=False)
+
+
+def write_seats(out, programs, entrants, faculty_size):
+    # Seat plan for synthetic programs, grouped into faculties of faculty_size programs;
+    # point SEATS_FILE at it before the first start of the app
+    plan = {op: {'seats': max(20, entrants // (10 * len(programs))), 'faculty': f'Faculty {i // faculty_size + 1}'}
+            for i, op in enumerate(programs)}
+    with open(os.path.join(out, 'seats.json'), 'w', encoding='utf-8') as f:
+        json.dump(plan, f, indent=2)
+
+
+def day_names(days):
+    # 01.08, 02.08, ... like the real campaign
+    return [f'{d + 1:02d}.08' for d in range(days)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate competition lists as {day}_{op}.csv')
+    parser.add_argument('--entrants', type=int, help='synthetic campaign size; omit for the fixed four days')
+    parser.add_argument('--programs', type=int, default=len(OPs), help='number of programs')
+    parser.add_argument('--overlap', default='0.4,0.3,0.2,0.1',
+                        help='share of entrants applying to 1, 2, 3, ... programs')
+    parser.add_argument('--churn', type=float, default=0.05, help='share of entrants leaving/changing per day')
+    parser.add_argument('--days', type=int, default=len(Days))
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--out', default='.')
+    parser.add_argument('--headers', choices=sorted(HEADERS), default='en')
+    parser.add_argument('--faculty-size', type=int, default=10, help='synthetic programs per faculty')
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    if args.entrants is None:
+        rng = random.Random(args.seed)
+        for day in Days:
+            write_day(args.out, day, OPs, fixed_day(day, rng), args.headers)
+        return
+    programs = OPs if args.programs == len(OPs) else [f'P{i + 1:03d}' for i in range(args.programs)]
+    overlap = [float(x) for x in args.overlap.split(',')]
+    campaign = synthetic_campaign(args.entrants, programs, overlap, args.churn, args.days, args.seed)
+    for day, df in zip(day_names(args.days), campaign):
+        write_day(args.out, day, programs, df, args.headers)
+    if programs is not OPs:
+        write_seats(args.out, programs, args.entrants, args.faculty_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 from app import app, generate_pdf
 
 with app.app_context():
-    generate_pdf()
\ No newline at end of file
+    with open("report.pdf", "wb") as f:
+        f.write(generate_pdf())
\ No newline at end of file
@@ -0,0 +1,143 @@
+import json
+
+# Grid columns -> SQL expressions; anything else in a sort/filter model is ignored
+PROGRAM_COLUMNS = {
+    'ID': 'e.id',
+    'Consent': 'a.consent',
+    'Priority': 'a.priority',
+    'Physics': 'e.phys',
+    'Russian': 'e.rus',
+    'Math': 'e.math',
+    'Individual': 'e.ind',
+    'Total': 'e.total',
+}
+NUMBER_OPERATORS = {
+    'equals': '=', 'notEqual': '!=', 'lessThan': '<', 'lessThanOrEqual': '<=',
+    'greaterThan': '>', 'greaterThanOrEqual': '>=',
+}
+MAX_BLOCK = 500
+
+
+def _value(value):
+    # Filter values are bound as SQL parameters: scalars only
+    if not isinstance(value, (int, float, str)):
+        raise ValueError(f'Bad filter value: {value!r}')
+    return value
+
+
+def _condition(column, model, params):
+    # One ag-Grid filter condition -> SQL, appending its parameters
+    if not isinstance(model, dict):
+        raise ValueError(f'Bad filter model: {model!r}')
+    if 'conditions' in model or 'condition1' in model:
+        parts = model.get('conditions') or [model['condition1'], model['condition2']]
+        if not isinstance(parts, list):
+            raise ValueError(f'Bad filter conditions: {parts!r}')
+        joiner = ' OR ' if model.get('operator') == 'OR' else ' AND '
+        return '(' + joiner.join(_condition(column, part, params) for part in parts) + ')'
+    kind = model.get('type')
+    if model.get('filterType') == 'text':
+        value = str(model.get('filter', ''))
+        patterns = {'contains': f'%{value}%', 'notContains': f'%{value}%', 'startsWith': f'{value}%',
+                    'endsWith': f'%{value}', 'equals': value, 'notEqual': value}
+        if kind not in patterns:
+            raise ValueError(f'Unsupported text filter: {kind}')
+        params.append(patterns[kind])
+        return f'CAST({column} AS TEXT) {"NOT LIKE" if kind in ("notContains", "notEqual") else "LIKE"} ?'
+    if kind == 'inRange':
+        params += [_value(model['filter']), _value(model['filterTo'])]
+        return f'{column} BETWEEN ? AND ?'
+    if kind == 'blank':
+        return f'{column} IS NULL'
+    if kind == 'notBlank':
+        return f'{column} IS NOT NULL'
+    if kind not in NUMBER_OPERATORS:
+        raise ValueError(f'Unsupported number filter: {kind}')
+    params.append(_value(model['filter']))
+    return f'{column} {NUMBER_OPERATORS[kind]} ?'
+
+
+def overall_columns(ops):
+    # Entrant scores plus one Priority/Consent pair per program, looked up by the unique (entrant_id, op) index
+    columns = {name: expr for name, expr in PROGRAM_COLUMNS.items() if expr.startswith('e.')}
+    for op in ops:
+        if not op.isalnum():
+            raise ValueError(f'Bad program name: {op}')
+        columns[f'{op} Priority'] = f"(SELECT priority FROM application WHERE entrant_id = e.id AND op = '{op}')"
+        columns[f'{op} Consent'] = f"(SELECT consent FROM application WHERE entrant_id = e.id AND op = '{op}')"
+    return columns
+
+
+def _block(session, columns, source, where, params, request, select=None):
+    # Rows startRow..endRow of a list, sorted and filtered in SQLite.
+    # request mirrors ag-Grid's getRows params: startRow, endRow, sortModel, filterModel.
+    # Only the select columns (all by default) are returned, any of columns can be sorted or filtered on.
+    # A malformed request is a ValueError (400), never an AttributeError or TypeError (500)
+    filter_model = request.get('filterModel') or {}
+    sort_model = request.get('sortModel') or []
+    if not isinstance(filter_model, dict):
+        raise ValueError('filterModel must be an object')
+    if not isinstance(sort_model, list) or not all(isinstance(s, dict) for s in sort_model):
+        raise ValueError('sortModel must be a list of objects')
+    start = max(int(_value(request.get('startRow', 0))), 0)
+    # endRow below startRow would make LIMIT negative, which SQLite reads as no limit
+    end = max(min(int(_value(request.get('endRow', start + 100))), start + MAX_BLOCK), start)
+    where = list(where)
+    params = list(params)
+    for field, model in filter_model.items():
+        if field in columns:
+            where.append(_condition(columns[field], model, params))
+    order = [f'{columns[s["colId"]]} {"DESC" if s.get("sort") == "desc" else "ASC"}'
+             for s in sort_model if s.get('colId') in columns]
+    # Default ranking matches the program lists: total desc, then id
+    order += ['e.total DESC', 'e.id']
+    select = ', '.join(f'{expr} AS "{name}"' for name, expr in (select or columns).items())
+    sql = (f'SELECT {select} FROM {source} '
+           f'{"WHERE " + " AND ".join(where) if where else ""} ORDER BY {", ".join(order)} LIMIT ? OFFSET ?')
+    result = session.connection().exec_driver_sql(sql, tuple(params + [end - start, start]))
+    names = list(result.keys())
+    rows = [dict(zip(names, row)) for row in result.fetchall()]
+    for row in rows:
+        for name in names:
+            if name.endswith('Consent') and row[name] is not None:
+                row[name] = bool(row[name])
+    # A short block means we reached the end; otherwise the grid keeps scrolling
+    last_row = start + len(rows) if len(rows) < end - start else -1
+    return {'rows': rows, 'lastRow': last_row}
+
+
+def fetch_block(session, op, request):
+    # One program's competition list
+    return _block(session, PROGRAM_COLUMNS, 'application a JOIN entrant e ON e.id = a.entrant_id',
+                  ['a.op = ?'], [op], request)
+
+
+def fetch_overall_block(session, ops, request):
+    # The overall list, one row per entrant. Program columns are only evaluated in SQL
+    # when sorted or filtered on; the block gets them from one query over its entrants.
+    columns = overall_columns(ops)
+    block = _block(session, columns, 'entrant e', [], [], request,
+                   select={name: expr for name, expr in columns.items() if expr.startswith('e.')})
+    rows = {}
+    for row in block['rows']:
+        row.update({name: None for name in columns if name not in row})
+        rows[row['ID']] = row
+    applications = session.connection().exec_driver_sql(
+        'SELECT entrant_id, op, priority, consent FROM application '
+        'WHERE entrant_id IN (SELECT value FROM json_each(?))', (json.dumps(list(rows)),))
+    for entrant_id, op, priority, consent in applications:
+        row = rows[entrant_id]
+        if f'{op} Priority' in row:
+            row[f'{op} Priority'] = priority
+            row[f'{op} Consent'] = bool(consent) if consent is not None else None
+    return block
+
+
+def datasource(url):
+    # JavaScript for an ag-Grid infinite row model that posts getRows params to url
+    return ('{getRows: (p) => fetch(' + json.dumps(url) + ', {method: "POST", '
+            'headers: {"Content-Type": "application/json"}, '
+            'body: JSON.stringify({startRow: p.startRow, endRow: p.endRow, sortModel: p.sortModel, '
+            'filterModel: p.filterModel})})'
+            '.then((r) => r.json()).then((d) => p.successCallback(d.rows, d.lastRow))'
+            '.catch(() => p.failCallback())}')
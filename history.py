@@ -0,0 +1,130 @@
+import json
+import numpy as np
+import pyarrow.compute as pc
+import daystore
+
+# Admission history of the campaign, one version per load.
+# history_day numbers the loads; admitted_span holds one row per continuous stretch
+# an entrant was admitted to a program (end_seq is NULL while they still are), so
+# a day only writes the entrants who entered or left the admitted lists.
+# Ranks in the full competition lists come from the stored day files.
+
+
+def record(session, day, admitted):
+    # Store the admitted lists of a freshly loaded day; reloading the latest day replaces it
+    conn = session.connection()
+    last = conn.exec_driver_sql('SELECT seq, day FROM history_day ORDER BY seq DESC LIMIT 1').fetchone()
+    if last is not None and last[1] == day:
+        seq = last[0]
+        conn.exec_driver_sql('DELETE FROM admitted_span WHERE start_seq = ?', (seq,))
+        conn.exec_driver_sql('UPDATE admitted_span SET end_seq = NULL WHERE end_seq = ?', (seq,))
+    else:
+        seq = last[0] + 1 if last is not None else 1
+        conn.exec_driver_sql('INSERT INTO history_day (seq, day) VALUES (?, ?)', (seq, day))
+    spans = conn.exec_driver_sql('SELECT id, op, entrant_id FROM admitted_span WHERE end_seq IS NULL').fetchall()
+    current = {(op, entrant_id) for op, ids in admitted.items() for entrant_id in np.asarray(ids).tolist()}
+    held = {(op, entrant_id) for _, op, entrant_id in spans}
+    left = [span_id for span_id, op, entrant_id in spans if (op, entrant_id) not in current]
+    conn.exec_driver_sql('UPDATE admitted_span SET end_seq = ? WHERE id IN (SELECT value FROM json_each(?))',
+                         (seq, json.dumps(left)))
+    entered = sorted(current - held)
+    if entered:
+        conn.exec_driver_sql('INSERT INTO admitted_span (op, entrant_id, start_seq) VALUES (?, ?, ?)',
+                             [(op, entrant_id, seq) for op, entrant_id in entered])
+    return seq
+
+
+def days(session):
+    # Recorded days in load order
+    return [day for day, in session.connection().exec_driver_sql('SELECT day FROM history_day ORDER BY seq')]
+
+
+def _seq(conn, day):
+    # A day loaded more than once means its latest version
+    seq = conn.exec_driver_sql('SELECT MAX(seq) FROM history_day WHERE day = ?', (day,)).scalar()
+    if seq is None:
+        raise KeyError(f'Day {day} is not in the history')
+    return seq
+
+
+def _admitted_ids(conn, op, seq):
+    rows = conn.exec_driver_sql('SELECT entrant_id FROM admitted_span '
+                                'WHERE op = ? AND start_seq <= ? AND (end_seq IS NULL OR end_seq > ?)', (op, seq, seq))
+    return {entrant_id for entrant_id, in rows}
+
+
+def _ranks(day, op, ids):
+    # entrant_id -> (rank, total) in the program's competition list of a stored day
+    if not ids or day not in daystore.days():
+        return {}
+    table = daystore.read(day)
+    # Day files are ranked within each program, so positions in the block are ranks
+    block = table.filter(pc.equal(table['op'], op))
+    block_ids = block['id'].to_numpy()
+    hits = np.flatnonzero(np.isin(block_ids, list(ids)))
+    totals = block['total'].to_numpy()[hits]
+    return {int(entrant_id): (int(pos) + 1, int(total))
+            for entrant_id, pos, total in zip(block_ids[hits], hits, totals)}
+
+
+def admitted_on(session, op, day):
+    # Who was admitted to op on day, best first
+    conn = session.connection()
+    ids = _admitted_ids(conn, op, _seq(conn, day))
+    ranks = _ranks(day, op, ids)
+    rows = [{'id': entrant_id, 'rank': ranks.get(entrant_id, (None, None))[0],
+             'total': ranks.get(entrant_id, (None, None))[1]} for entrant_id in ids]
+    return sorted(rows, key=lambda row: (row['rank'] is None, row['rank'] or 0, row['id']))
+
+
+def diff(session, op, before, after):
+    # How the admitted list of op changed between two days, with rank moves
+    conn = session.connection()
+    old = _admitted_ids(conn, op, _seq(conn, before))
+    new = _admitted_ids(conn, op, _seq(conn, after))
+    old_ranks = _ranks(before, op, old | new)
+    new_ranks = _ranks(after, op, old | new)
+
+    def moves(ids):
+        return [{'id': entrant_id, 'rank': [old_ranks.get(entrant_id, (None,))[0], new_ranks.get(entrant_id, (None,))[0]]}
+                for entrant_id in sorted(ids)]
+
+    return {
+        'op': op,
+        'days': [before, after],
+        'entered': moves(new - old),
+        'left': moves(old - new),
+        'stayed': moves(old & new),
+    }
+
+
+def _entrant_ranks(table, entrant_id):
+    # op -> (rank, total) of one entrant in a stored day: one scan of the id column,
+    # then the start of each program's block (files are sorted by program, then rank)
+    hits = np.flatnonzero(table['id'].to_numpy() == entrant_id)
+    ranks = {}
+    for row in hits.tolist():
+        op = table['op'][row].as_py()
+        start = pc.index(table['op'], op).as_py()
+        ranks[op] = (row - start + 1, table['total'][row].as_py())
+    return ranks
+
+
+def entrant(session, entrant_id):
+    # One entrant across the campaign: rank and admission in every program they applied to
+    conn = session.connection()
+    spans = conn.exec_driver_sql('SELECT op, start_seq, end_seq FROM admitted_span WHERE entrant_id = ?',
+                                 (entrant_id,)).fetchall()
+    latest = dict(conn.exec_driver_sql('SELECT day, MAX(seq) FROM history_day GROUP BY day').fetchall())
+    stored = set(daystore.days())
+    result = []
+    for seq, day in conn.exec_driver_sql('SELECT seq, day FROM history_day ORDER BY seq').fetchall():
+        admitted = {op for op, start, end in spans if start <= seq and (end is None or end > seq)}
+        # Ranks are only known for the latest version of a stored day
+        ranks = _entrant_ranks(daystore.read(day), entrant_id) if seq == latest[day] and day in stored else {}
+        programs = {}
+        for op in sorted(admitted | set(ranks)):
+            rank, total = ranks.get(op, (None, None))
+            programs[op] = {'rank': rank, 'total': total, 'admitted': op in admitted}
+        result.append({'day': day, 'programs': programs})
+    return result
@@ -0,0 +1,257 @@
+import collections
+import glob
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import metrics
+import validate
+
+# CSV columns -> entrant/application table columns
+ENTRANT_COLUMNS = {'ID': 'id', 'Physics': 'phys', 'Russian': 'rus', 'Math': 'math', 'Individual': 'ind', 'Total': 'total'}
+APPLICATION_COLUMNS = {'Priority': 'priority', 'Consent': 'consent'}
+# Headers of the older Russian exports
+RUSSIAN_COLUMNS = {'ID': 'id', 'Физика/ИКТ': 'phys', 'Русский язык': 'rus', 'Математика': 'math', 'ИД': 'ind',
+                   'Всего': 'total', 'Приоритет': 'priority', 'Согласие': 'consent'}
+# Any known spelling, compared case-insensitively -> table column
+HEADERS = {name.lower(): column
+           for name, column in {**ENTRANT_COLUMNS, **APPLICATION_COLUMNS, **RUSSIAN_COLUMNS}.items()}
+# Scores and priorities fit in int16; ids do not have to
+DTYPES = {'id': 'int64', 'phys': 'int16', 'rus': 'int16', 'math': 'int16', 'ind': 'int16', 'total': 'int16',
+          'priority': 'int16', 'consent': 'bool'}
+TRUE_VALUES = ['True', 'true', 'TRUE', '1', 'Да', 'да']
+FALSE_VALUES = ['False', 'false', 'FALSE', '0', 'Нет', 'нет']
+# Rows per chunk; memory use depends on this, not on the file size
+CHUNK_SIZE = 100_000
+# Threads parsing per-program files side by side, each at most PARSE_AHEAD chunks ahead
+PARSE_WORKERS = min(os.cpu_count() or 1, 4)
+PARSE_AHEAD = 2
+
+
+def normalize_header(header):
+    # CSV header -> {CSV name: table column}; English and Russian exports are both
+    # accepted. Unknown columns are skipped, missing ones fail validation row by row.
+    mapping = {}
+    for name in header:
+        column = HEADERS.get(str(name).strip().lower())
+        if column is not None and column not in mapping.values():
+            mapping[name] = column
+    return mapping
+
+
+def discover(day, path='../{day}_{op}.csv'):
+    # Programs that have a CSV for the day, from the file names
+    prefix, suffix = path.format(day=day, op='\0').split('\0')
+    found = glob.glob(glob.escape(prefix) + '*' + glob.escape(suffix))
+    ops = [name[len(prefix):len(name) - len(suffix)] for name in found]
+    return sorted(op for op in ops if op.isalnum())
+
+
+def _read_file(op, filepath, chunksize):
+    # Types are left to the parser: a bad value must not fail the file, validation
+    # coerces the columns and sets such rows aside. line is the row's line in the file.
+    header = pd.read_csv(filepath, nrows=0, encoding='utf-8-sig').columns
+    mapping = normalize_header(list(header))
+    reader = pd.read_csv(filepath, usecols=list(mapping), encoding='utf-8-sig',
+                         true_values=TRUE_VALUES, false_values=FALSE_VALUES, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            chunk = chunk.rename(columns=mapping)
+            chunk['op'] = op
+            chunk['line'] = chunk.index + 2
+            yield chunk
+
+
+def _put(out, item, stop):
+    # Waits for room in the queue unless the reader went away
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _parse_ahead(out, stop, op, filepath, chunksize):
+    # Runs in a pool thread: the file's chunks into its bounded queue, then None (or the error)
+    try:
+        for chunk in _read_file(op, filepath, chunksize):
+            if not _put(out, chunk, stop):
+                return
+    except Exception as e:
+        _put(out, e, stop)
+        return
+    _put(out, None, stop)
+
+
+def iter_day(day, ops, path='../{day}_{op}.csv', chunksize=CHUNK_SIZE, workers=PARSE_WORKERS):
+    # Chunks of every CSV of the day, with the op column added, in file order
+    files = [(op, path.format(day=day, op=op)) for op in ops]
+    files = [(op, filepath) for op, filepath in files if os.path.exists(filepath)]
+    if workers <= 1 or len(files) <= 1:
+        for op, filepath in files:
+            yield from _read_file(op, filepath, chunksize)
+        return
+    # Up to `workers` files are parsed ahead in threads, chunk by chunk through bounded
+    # queues, so memory still depends on chunksize and not on the file sizes
+    stop = threading.Event()
+    pending = collections.deque()
+    remaining = iter(files)
+
+    def start_next(pool):
+        for op, filepath in remaining:
+            out = queue.Queue(maxsize=PARSE_AHEAD)
+            pool.submit(_parse_ahead, out, stop, op, filepath, chunksize)
+            pending.append(out)
+            return
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for _ in range(workers):
+                start_next(pool)
+            while pending:
+                out = pending.popleft()
+                while True:
+                    item = out.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+                start_next(pool)
+        finally:
+            # Readers that stop early (or fail) release the threads still waiting to put
+            stop.set()
+
+
+def read_day(day, ops, path='../{day}_{op}.csv'):
+    # The whole day as one frame, for callers that need it in memory
+    frames = list(iter_day(day, ops, path))
+    if not frames:
+        return pd.DataFrame(columns=list(DTYPES) + ['op', 'line'])
+    return pd.concat(frames, ignore_index=True)
+
+
+def bulk_upsert(session, df):
+    # Write the day with a few set-based statements inside the session transaction.
+    # Returns the ids of entrants that were inserted or changed, as the change set
+    # for incremental allocation.
+    changes = {'inserted': set(), 'updated': set()}
+    if df.empty:
+        return 0, 0, changes
+    conn = session.connection()
+    # An entrant appears in several CSVs; the last row wins, as before
+    entrants = df.drop_duplicates('id', keep='last')[list(ENTRANT_COLUMNS.values())]
+    apps = df.drop_duplicates(['id', 'op'], keep='last')
+    totals = apps['id'].map(entrants.set_index('id')['total'])
+    # Stage applications, then diff them against the entrant/application tables
+    conn.exec_driver_sql('CREATE TEMP TABLE IF NOT EXISTS staging_application '
+                         '(entrant_id INTEGER, op VARCHAR(10), priority INTEGER, consent BOOLEAN, total INTEGER, '
+                         'PRIMARY KEY (entrant_id, op))')
+    conn.exec_driver_sql('DELETE FROM staging_application')
+    conn.exec_driver_sql(
+        'INSERT INTO staging_application (entrant_id, op, priority, consent, total) VALUES (?, ?, ?, ?, ?)',
+        list(zip(apps['id'].tolist(), apps['op'].tolist(), apps['priority'].tolist(), apps['consent'].tolist(),
+                 totals.tolist())),
+    )
+    rows = conn.exec_driver_sql(
+        'SELECT s.entrant_id, e.id IS NULL FROM staging_application s '
+        'LEFT JOIN entrant e ON e.id = s.entrant_id '
+        'LEFT JOIN application a ON a.entrant_id = s.entrant_id AND a.op = s.op '
+        'WHERE e.id IS NULL OR a.id IS NULL OR e.total != s.total '
+        'OR a.priority != s.priority OR a.consent != s.consent'
+    ).fetchall()
+    for entrant_id, inserted in rows:
+        changes['inserted' if inserted else 'updated'].add(entrant_id)
+    conn.exec_driver_sql(
+        'INSERT INTO entrant (id, phys, rus, math, ind, total) VALUES (?, ?, ?, ?, ?, ?) '
+        'ON CONFLICT(id) DO UPDATE SET phys = excluded.phys, rus = excluded.rus, math = excluded.math, '
+        'ind = excluded.ind, total = excluded.total',
+        [tuple(r) for r in entrants.to_numpy().tolist()],
+    )
+    # WHERE true keeps SQLite from parsing ON CONFLICT as a join constraint
+    conn.exec_driver_sql(
+        'INSERT INTO application (entrant_id, op, priority, consent) '
+        'SELECT entrant_id, op, priority, consent FROM staging_application WHERE true '
+        'ON CONFLICT(entrant_id, op) DO UPDATE SET priority = excluded.priority, consent = excluded.consent'
+    )
+    conn.exec_driver_sql('DELETE FROM staging_application')
+    # ORM objects in the session are stale after raw statements
+    session.expire_all()
+    return len(entrants), len(apps), changes
+
+
+def _batches(chunks, size):
+    # Small per-program files are written together, up to size rows at a time
+    batch, count = [], 0
+    for chunk in chunks:
+        batch.append(chunk)
+        count += len(chunk)
+        if count >= size:
+            yield batch[0] if len(batch) == 1 else pd.concat(batch, ignore_index=True)
+            batch, count = [], 0
+    if batch:
+        yield batch[0] if len(batch) == 1 else pd.concat(batch, ignore_index=True)
+
+
+def load_csvs(session, day, ops, path='../{day}_{op}.csv', progress=None, chunksize=CHUNK_SIZE):
+    # Streams the day chunk by chunk into bulk_upsert, so only a chunk (or the few
+    # files parsed ahead) is in memory; ops=None loads every program CSV found
+    if ops is None:
+        ops = discover(day, path)
+    return _load(session, day, _batches(iter_day(day, ops, path, chunksize), chunksize), progress)
+
+
+def load_frame(session, day, frame, progress=None, chunksize=CHUNK_SIZE):
+    # A day parsed elsewhere (read_day, e.g. in a replay worker), written in chunksize slices
+    return _load(session, day, (frame.iloc[i:i + chunksize] for i in range(0, len(frame), chunksize)), progress)
+
+
+def _load(session, day, chunks, progress):
+    # An entrant listed in several files or chunks is upserted each time, the last row wins.
+    # Rows failing validation are quarantined, the rest of the chunk is loaded.
+    start = time.perf_counter()
+    rows = applications = 0
+    entrant_ids = []
+    changes = {'inserted': set(), 'updated': set()}
+    check = validate.DayCheck(TRUE_VALUES, FALSE_VALUES, DTYPES)
+    ops = set()
+    while True:
+        with metrics.stage('parse'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        rows += len(chunk)
+        metrics.inc('rows_parsed_total', len(chunk))
+        if progress:
+            progress('parsed', rows=rows)
+        ops.update(chunk['op'].unique().tolist())
+        with metrics.stage('validate'):
+            chunk = check(chunk)
+        with metrics.stage('upsert'):
+            _, chunk_applications, chunk_changes = bulk_upsert(session, chunk)
+        applications += chunk_applications
+        entrant_ids.append(chunk['id'].unique())
+        changes['inserted'] |= chunk_changes['inserted']
+        changes['updated'] |= chunk_changes['updated']
+        if progress:
+            progress('upserted', rows=applications)
+    # An entrant inserted by an earlier chunk shows up as updated in later ones
+    changes['updated'] -= changes['inserted']
+    validate.store(session, day, ops, check.rejected)
+    metrics.inc('rows_quarantined_total', len(check.rejected))
+    elapsed = time.perf_counter() - start
+    return {
+        'day': day,
+        'rows': rows,
+        'entrants': len(np.unique(np.concatenate(entrant_ids))) if entrant_ids else 0,
+        'applications': applications,
+        'quarantined': len(check.rejected),
+        'changes': changes,
+        'seconds': elapsed,
+        'rows_per_sec': rows / elapsed if elapsed > 0 else 0.0,
+    }
@@ -0,0 +1,54 @@
+import weakref
+import numpy as np
+import pandas as pd
+
+# Rows of the live dashboard: the admitted list of every program with ranks,
+# keyed by "<op>:<id>". A new data version is sent to the browsers as an ag-Grid
+# transaction against the previous one, so only rows that changed travel.
+COLUMNS = ['op', 'id', 'rank', 'total', 'priority', 'consent']
+# Built once per snapshot: for the diff of the load and for every page opened on it
+_rows = weakref.WeakKeyDictionary()
+
+
+def rows(snap):
+    if snap is None:
+        return pd.DataFrame(columns=COLUMNS, index=pd.Index([], dtype=object))
+    if snap in _rows:
+        return _rows[snap]
+    frames = []
+    for op in snap.ops:
+        frame = snap.programs[op]
+        # Program lists are ranked, so positions in the list are ranks
+        hits = np.flatnonzero(np.isin(frame['id'].to_numpy(), np.asarray(snap.admitted[op])))
+        block = frame.iloc[hits][['id', 'total', 'priority', 'consent']].assign(op=op, rank=hits + 1)
+        frames.append(block[COLUMNS])
+    df = pd.concat(frames, ignore_index=True)
+    df.index = df['op'] + ':' + df['id'].astype(str)
+    _rows[snap] = df
+    return df
+
+
+def records(df):
+    return df.rename_axis('key').reset_index().to_dict('records')
+
+
+def transaction(old, new):
+    common = new.index.intersection(old.index)
+    changed = (old.loc[common, COLUMNS].to_numpy() != new.loc[common, COLUMNS].to_numpy()).any(axis=1)
+    return {
+        'add': records(new.loc[new.index.difference(old.index)]),
+        'update': records(new.loc[common[changed]]),
+        'remove': [{'key': key} for key in old.index.difference(new.index)],
+    }
+
+
+def change(previous, snap):
+    # Everything a dashboard at previous.version needs to show snap
+    return {
+        'from': previous.version if previous is not None else None,
+        'version': snap.version,
+        'day': snap.day,
+        'cutoffs': dict(snap.cutoffs),
+        'previous_cutoffs': dict(previous.cutoffs) if previous is not None else {},
+        'transaction': transaction(rows(previous), rows(snap)),
+    }
@@ -1,7 +1,11 @@
-from app import app, load_day
+import time
+from app import app, load_day, OPS
+import replay
 
 days = ['01.08', '02.08', '03.08', '04.08']
 
 with app.app_context():
-    for day in days:
-        load_day(day)
\ No newline at end of file
+    # The next day's CSVs are parsed in a worker process while this one is applied
+    start = time.perf_counter()
+    timings = replay.run(days, lambda day, frame: load_day(day, frame), OPS)
+    print(replay.report(timings, time.perf_counter() - start))
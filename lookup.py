@@ -0,0 +1,89 @@
+import numpy as np
+
+# Where one entrant stands, answered from arrays built once per snapshot:
+# every application sorted by entrant id (found by binary search), its position
+# in the program's ranked list, and per-program prefix sums of consents.
+
+
+class RankIndex:
+    def __init__(self, snap):
+        self.ops = list(snap.ops)
+        self.cutoffs = dict(snap.cutoffs)
+        self.sizes = {}
+        self.consents = {}  # op -> consented applicants at or above each position
+        # Key (-total, id) of the last admitted entrant of each full program
+        self.last_admitted = {}
+        ids, codes, positions, priorities, consent, totals = [], [], [], [], [], []
+        for code, op in enumerate(self.ops):
+            frame = snap.programs[op]
+            self.sizes[op] = len(frame)
+            self.consents[op] = np.cumsum(frame['consent'].to_numpy(dtype=bool))
+            ids.append(frame['id'].to_numpy(dtype=np.int64))
+            codes.append(np.full(len(frame), code, dtype=np.int64))
+            positions.append(np.arange(len(frame), dtype=np.int64))
+            priorities.append(frame['priority'].to_numpy(dtype=np.int64))
+            consent.append(frame['consent'].to_numpy(dtype=bool))
+            totals.append(frame['total'].to_numpy(dtype=np.int64))
+            admitted = snap.admitted[op]
+            if self.cutoffs[op] is not None and len(admitted):
+                self.last_admitted[op] = (-self.cutoffs[op], int(admitted[-1]))
+        ids = np.concatenate(ids)
+        order = np.argsort(ids, kind='stable')
+        self.app_ids = ids[order]
+        self.app_ops = np.concatenate(codes)[order]
+        self.app_positions = np.concatenate(positions)[order]
+        self.app_priorities = np.concatenate(priorities)[order]
+        self.app_consent = np.concatenate(consent)[order]
+        self.app_totals = np.concatenate(totals)[order]
+        admitted_ids = np.concatenate([snap.admitted[op] for op in self.ops]).astype(np.int64)
+        admitted_ops = np.concatenate([np.full(len(snap.admitted[op]), code, dtype=np.int64)
+                                       for code, op in enumerate(self.ops)])
+        order = np.argsort(admitted_ids, kind='stable')
+        self.admitted_ids = admitted_ids[order]
+        self.admitted_ops = admitted_ops[order]
+
+    def _passes(self, op, total, entrant_id):
+        # Within the admitted range of the program, i.e. would get a seat there if
+        # nothing better-ranked took it: any score while it is not full
+        last = self.last_admitted.get(op)
+        return last is None or (-total, entrant_id) <= last
+
+    def lookup(self, entrant_id):
+        lo = np.searchsorted(self.app_ids, entrant_id, side='left')
+        hi = np.searchsorted(self.app_ids, entrant_id, side='right')
+        if lo == hi:
+            return None
+        total = int(self.app_totals[lo])
+        at = np.searchsorted(self.admitted_ids, entrant_id)
+        admitted_to = None
+        if at < len(self.admitted_ids) and self.admitted_ids[at] == entrant_id:
+            admitted_to = self.ops[self.admitted_ops[at]]
+        programs = []
+        for i in range(lo, hi):
+            op = self.ops[self.app_ops[i]]
+            position = int(self.app_positions[i])
+            cutoff = self.cutoffs[op]
+            programs.append({
+                'op': op,
+                'priority': int(self.app_priorities[i]),
+                'consent': bool(self.app_consent[i]),
+                'rank': position + 1,
+                'applicants': self.sizes[op],
+                # Consented applicants ranked above this entrant compete for the same seats
+                'consented_above': int(self.consents[op][position] - self.app_consent[i]),
+                'cutoff': cutoff,
+                'margin': None if cutoff is None else total - cutoff,
+                'passes': self._passes(op, total, entrant_id),
+                'admitted': op == admitted_to,
+            })
+        programs.sort(key=lambda p: (p['priority'], self.ops.index(p['op'])))
+        # Best priority the score is good enough for, with consent given there
+        passing = [p['priority'] for p in programs if p['passes']]
+        return {
+            'id': int(entrant_id),
+            'total': total,
+            'admitted_to': admitted_to,
+            'admitted_priority': next((p['priority'] for p in programs if p['admitted']), None),
+            'best_passing_priority': passing[0] if passing else None,
+            'programs': programs,
+        }
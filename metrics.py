@@ -0,0 +1,136 @@
+import collections
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# Process-wide counters and stage timers, served on /metrics in the Prometheus
+# text format. While profiling is on (PROFILING=1 or /api/profiling), every
+# captured call - a load, a report - also keeps a cProfile summary and the SQL
+# it issued; cProfile only sees the thread the call runs in.
+PREFIX = 'admission_'
+METRICS = {
+    'rows_parsed_total': ('counter', 'CSV rows parsed'),
+    'rows_quarantined_total': ('counter', 'CSV rows set aside by validation'),
+    'sql_statements_total': ('counter', 'SQL statements issued, executemany counted once'),
+    'orm_objects_total': ('counter', 'ORM objects hydrated from query results'),
+    'report_bytes_total': ('counter', 'PDF report bytes rendered'),
+    'loads_total': ('counter', 'Days loaded'),
+    'source_requests_total': ('counter', 'List requests to the sources, by result'),
+    'source_bytes_total': ('counter', 'List bytes downloaded from the sources'),
+    'stage_seconds': ('summary', 'Time spent in each stage'),
+}
+PROFILE_LINES = 30
+
+_values = collections.defaultdict(float)  # (name, labels) -> value
+_lock = threading.Lock()
+_local = threading.local()  # SQL statements of the capture running in this thread
+_capture_lock = threading.Lock()
+
+profiling = os.environ.get('PROFILING') == '1'
+captures = collections.deque(maxlen=20)
+
+
+def inc(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _values[key] += value
+
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        inc('stage_seconds_sum', time.perf_counter() - start, stage=name)
+        inc('stage_seconds_count', stage=name)
+
+
+def stage_totals():
+    # stage -> seconds spent so far, for callers that report their own timings
+    with _lock:
+        return {dict(labels)['stage']: value for (name, labels), value in _values.items()
+                if name == 'stage_seconds_sum'}
+
+
+def instrument(engine, name):
+    # Counts every statement of the engine and echoes it into a running capture
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        inc('sql_statements_total', engine=name)
+        sql = getattr(_local, 'sql', None)
+        if sql is not None:
+            sql.append(f'{statement} -- {len(parameters)} rows' if executemany else statement)
+
+    event.listen(engine, 'before_cursor_execute', before_execute)
+
+
+def watch(base):
+    # Counts ORM instances built from rows, per model
+    event.listen(base, 'load', lambda target, context: inc('orm_objects_total', model=type(target).__name__),
+                 propagate=True)
+
+
+@contextmanager
+def capture(name, enabled=None):
+    # enabled=None follows the global toggle; nested captures are part of the outer one.
+    # One capture runs at a time (Python 3.12+ allows a single active profiler), a
+    # call arriving meanwhile runs without one.
+    if not (profiling if enabled is None else enabled) or getattr(_local, 'sql', None) is not None:
+        yield
+        return
+    if not _capture_lock.acquire(blocking=False):
+        yield
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler (not ours) is active
+        profile = None
+    if profile is None:
+        _capture_lock.release()
+        yield
+        return
+    _local.sql = []
+    started = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.disable()
+        _capture_lock.release()
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        captures.append({
+            'name': name,
+            'started': started,
+            'seconds': time.perf_counter() - start,
+            'sql': _local.sql,
+            'profile': stream.getvalue(),
+        })
+        _local.sql = None
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+def render():
+    with _lock:
+        values = sorted(_values.items())
+    lines = []
+    for base, (kind, help_text) in METRICS.items():
+        names = (base + '_sum', base + '_count') if kind == 'summary' else (base,)
+        lines.append(f'# HELP {PREFIX}{base} {help_text}')
+        lines.append(f'# TYPE {PREFIX}{base} {kind}')
+        for (name, labels), value in values:
+            if name in names:
+                lines.append(f'{PREFIX}{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,123 @@
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import daystore
+import metrics
+
+# Last rendered report, keyed by snapshot version
+_cache = {}
+_lock = threading.Lock()
+CHART_WORKERS = 8
+# Lines per chart above which the legend would cover the plot
+LEGEND_LIMIT = 12
+
+
+def score_history(session, ops):
+    # Passing score dynamics of every program from one query
+    rows = session.connection().exec_driver_sql(
+        'SELECT op, day, score FROM passing_score ORDER BY op, day, id').fetchall()
+    history = {op: [] for op in ops}
+    for op, day, score in rows:
+        if op in history:
+            history[op].append((day, score))
+    return history
+
+
+def render_chart(title, series):
+    # Figure + Agg canvas instead of pyplot: no global state, safe to run in threads.
+    # series: op -> [(day, score)], one line per program of the group.
+    # matplotlib and fpdf are imported on the first report, not at startup
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    for op, scores in series.items():
+        days = [day for day, _ in scores]
+        vals = [score if score is not None else 0 for _, score in scores]
+        ax.plot(days, vals, label=op)
+    if 1 < len(series) <= LEGEND_LIMIT:
+        ax.legend(fontsize='small')
+    ax.set_title(f"Passing Score Dynamics for {title}")
+    ax.set_xlabel("Day")
+    ax.set_ylabel("Score")
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+def render_charts(history, groups):
+    # One chart per group (faculty) rather than per program, so the report stays
+    # readable with hundreds of programs
+    todo = {}
+    for title, ops in groups.items():
+        series = {op: history[op] for op in ops if history.get(op)}
+        if series:
+            todo[title] = series
+    if not todo:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(todo), CHART_WORKERS)) as pool:
+        images = pool.map(render_chart, todo.keys(), todo.values())
+        return dict(zip(todo.keys(), images))
+
+
+def build_pdf(snap, history, groups=None):
+    from fpdf import FPDF
+    groups = groups or {op: [op] for op in snap.ops}
+    with metrics.stage('report_charts'):
+        charts = render_charts(history, groups)
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("helvetica", size=12)
+
+    def line(text, **kwargs):
+        pdf.cell(200, 10, text=text, new_x='LMARGIN', new_y='NEXT', **kwargs)
+
+    line("Admission Report", align='C')
+    line("Date and Time: " + datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+    # Passing scores (latest for each OP)
+    line("Passing Scores")
+    for title, ops in groups.items():
+        if ops != [title]:
+            line(title)
+        for op in ops:
+            if not history.get(op):
+                score_text = "N/A"
+            else:
+                score = history[op][-1][1]
+                score_text = "NEDOBOR" if score is None else str(score)
+            line(f"{op}: {score_text}")
+    # Dynamics graphs
+    for title in groups:
+        if title in charts:
+            pdf.image(io.BytesIO(charts[title]), w=100)
+    # Enrolled lists
+    pdf.add_page()
+    line("Enrolled Applicants")
+    for op in snap.ops:
+        line(f"{op}")
+        for entrant_id in snap.admitted[op].tolist():
+            line(f"ID: {entrant_id}, Total: {snap.totals[entrant_id]}")
+    output = bytes(pdf.output())
+    metrics.inc('report_bytes_total', len(output))
+    return output
+
+
+def get_report(session, snap, groups=None):
+    # groups: chart title (faculty) -> its programs; one chart per program by default
+    # Repeated downloads of the same data version are served from memory
+    with _lock:
+        cached = _cache.get(snap.version)
+    if cached is not None:
+        return cached
+    # Stored day files carry the cutoffs; older databases only have passing_score
+    with metrics.stage('report_history'):
+        history = daystore.history(snap.ops) if daystore.days() else score_history(session, snap.ops)
+    # report_render includes report_charts
+    with metrics.stage('report_render'):
+        pdf = build_pdf(snap, history, groups)
+    with _lock:
+        _cache.clear()
+        _cache[snap.version] = pdf
+    return pdf
@@ -0,0 +1,42 @@
+import seats
+
+# Registry of the campaign's programs: code, name, faculty and seats, in program
+# order. The program table is
+# synced from the seat plan on every start: programs added to the plan are
+# appended, seats, names and faculties of existing ones follow the plan, and
+# program order never changes.
+
+
+def sync(session, plan=None):
+    plan = seats.entries() if plan is None else plan
+    session.connection().exec_driver_sql(
+        'INSERT INTO program (code, name, faculty, seats) VALUES (?, ?, ?, ?) ON CONFLICT(code) DO UPDATE SET '
+        'seats = excluded.seats, name = excluded.name, faculty = excluded.faculty',
+        [(p['code'], p['name'], p['faculty'], p['seats']) for p in plan])
+    return load(session)
+
+
+def load(session):
+    rows = session.connection().exec_driver_sql('SELECT code, name, faculty, seats FROM program ORDER BY id')
+    return [{'code': code, 'name': name, 'faculty': faculty, 'seats': count} for code, name, faculty, count in rows]
+
+
+def codes(registry):
+    return [p['code'] for p in registry]
+
+
+def spots(registry):
+    return {p['code']: p['seats'] for p in registry}
+
+
+def faculties(registry):
+    # faculty -> its program codes, both in registry order
+    result = {}
+    for p in registry:
+        result.setdefault(p['faculty'] or 'Other programs', []).append(p['code'])
+    return result
+
+
+def unregistered(registry, ops):
+    # Programs with a list but no entry in the registry (and so no seats)
+    return sorted(set(ops) - set(codes(registry)))
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import allocation
+
+ENTRANT_FIELDS = [('id', 'ID'), ('phys', 'Physics'), ('rus', 'Russian'), ('math', 'Math'), ('ind', 'Individual'),
+                  ('total', 'Total')]
+
+
+def _frame(session, sql, params=()):
+    # Plain DBAPI rows straight into a DataFrame, without ORM objects or read_sql overhead
+    result = session.connection().exec_driver_sql(sql, params)
+    return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+
+def applications_frame(session):
+    # Every application with its entrant's scores, ranked within each program
+    df = _frame(session, 'SELECT a.op, e.id, e.total, a.consent, a.priority, e.phys, e.rus, e.math, e.ind '
+                         'FROM application a JOIN entrant e ON e.id = a.entrant_id ORDER BY a.op, e.total DESC, e.id')
+    df['consent'] = df['consent'].astype(bool)
+    return df
+
+
+def split_programs(df, ops):
+    # Long applications frame -> one ranked list per program
+    groups = dict(tuple(df.groupby('op', sort=False)))
+    empty = df.iloc[0:0]
+    return {op: groups.get(op, empty).drop(columns='op').reset_index(drop=True) for op in ops}
+
+
+def pivot_overall(df, ops):
+    # Entrant scores plus "<op> Priority"/"<op> Consent" columns, scattered with NumPy from the
+    # applications frame: one (entrant, program) matrix per field, filled in a single pass for all programs
+    entrants = df.drop_duplicates('id')[[field for field, _ in ENTRANT_FIELDS]].sort_values('id')
+    overall = entrants.rename(columns=dict(ENTRANT_FIELDS)).reset_index(drop=True)
+    rows = np.searchsorted(overall['ID'].to_numpy(), df['id'].to_numpy())
+    cols = allocation.codes(df['op'].to_numpy(), ops)
+    known = cols >= 0
+    rows, cols = rows[known], cols[known]
+    shape = (len(overall), len(ops))
+    missing = np.ones(shape, dtype=bool)
+    missing[rows, cols] = False
+    priority = np.zeros(shape, dtype=np.int64)
+    priority[rows, cols] = df['priority'].to_numpy()[known]
+    consent = np.full(shape, np.nan, dtype=object)
+    consent[rows, cols] = df['consent'].to_numpy()[known]
+    columns = {}
+    for code, op in enumerate(ops):
+        columns[f'{op} Priority'] = pd.arrays.IntegerArray(priority[:, code].copy(), missing[:, code].copy())
+        columns[f'{op} Consent'] = consent[:, code]
+    return pd.concat([overall, pd.DataFrame(columns, index=overall.index)], axis=1)
+
@@ -0,0 +1,79 @@
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+import ingest
+import metrics
+
+# Replay of a whole campaign: a worker process parses day N+1's CSVs while day N
+# is applied (churn, upsert, allocation, commit) in this process, so reading and
+# parsing overlap with the database work. Days are still applied and committed
+# strictly in order.
+#
+# load(day, frame) applies one parsed day, e.g. load_day of either app.
+
+DAYS = ['01.08', '02.08', '03.08', '04.08']
+
+
+def parse_day(day, ops, path='../{day}_{op}.csv'):
+    # Runs in the worker: every program CSV of the day, registered programs first in
+    # registry order so rows (and application ids) come out as in a plain load
+    found = ingest.discover(day, path)
+    ordered = [op for op in ops if op in found] + [op for op in found if op not in ops]
+    start = time.perf_counter()
+    frame = ingest.read_day(day, ordered, path)
+    return frame, time.perf_counter() - start
+
+
+def run(days, load, ops, path='../{day}_{op}.csv', pipelined=True):
+    # Returns per-day timings: parse (in the worker), wait (parse not hidden behind
+    # the previous day), apply, and the stages of the apply
+    timings = []
+    pool = ProcessPoolExecutor(max_workers=1) if pipelined else None
+    try:
+        ahead = pool.submit(parse_day, days[0], ops, path) if pool and days else None
+        for i, day in enumerate(days):
+            start = time.perf_counter()
+            frame, parse = ahead.result() if pool else parse_day(day, ops, path)
+            wait = time.perf_counter() - start
+            if pool and i + 1 < len(days):
+                ahead = pool.submit(parse_day, days[i + 1], ops, path)
+            before = metrics.stage_totals()
+            start = time.perf_counter()
+            stats = load(day, frame)
+            apply = time.perf_counter() - start
+            stages = {stage: seconds - before.get(stage, 0.0) for stage, seconds in metrics.stage_totals().items()
+                      if seconds - before.get(stage, 0.0) > 0}
+            timings.append({'day': day, 'rows': stats['rows'], 'parse': parse, 'wait': wait, 'apply': apply,
+                            'stages': stages})
+    finally:
+        if pool:
+            pool.shutdown(cancel_futures=True)
+    return timings
+
+
+def report(timings, total):
+    lines = [f'{"day":<8}{"rows":>10}{"parse":>9}{"wait":>9}{"apply":>9}  stages']
+    for t in timings:
+        stages = ', '.join(f'{stage} {seconds:.2f}' for stage, seconds in sorted(t['stages'].items(),
+                                                                                key=lambda item: -item[1]))
+        lines.append(f'{t["day"]:<8}{t["rows"]:>10}{t["parse"]:>9.2f}{t["wait"]:>9.2f}{t["apply"]:>9.2f}  {stages}')
+    hidden = sum(t['parse'] for t in timings) - sum(t['wait'] for t in timings)
+    lines.append(f'total {total:.2f}s, {max(hidden, 0):.2f}s of parsing overlapped with applying')
+    return '\n'.join(lines)
+
+
+def main():
+    # Replays into the NiceGUI app's database (admission.db in the working directory)
+    parser = argparse.ArgumentParser(description='Replay campaign days with parsing pipelined ahead')
+    parser.add_argument('days', nargs='*', default=DAYS)
+    parser.add_argument('--sequential', action='store_true', help='parse each day in turn, for comparison')
+    args = parser.parse_args()
+    import app_NEW
+    start = time.perf_counter()
+    timings = run(args.days, lambda day, frame: app_NEW.load_day(day, frame=frame), app_NEW.OPS,
+                  pipelined=not args.sequential)
+    print(report(timings, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 from app import app, db
+import schema
+import daystore
 
 with app.app_context():
     db.drop_all()
-    db.create_all()
\ No newline at end of file
+    schema.setup(db.engine, db.metadata)
+    daystore.clear()
@@ -0,0 +1,135 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import allocation
+
+# What-if runs of the allocation. A scenario changes the seat plan and/or lets a
+# share of the non-consented applications give consent; with a consent share
+# every run draws a different random set, so a batch of runs gives a
+# distribution of cutoffs per program.
+#
+# scenario = {'name': 'IB +10', 'seats': {'IB': 10}, 'consent': 0.2}
+# 'seats' are added to the base plan, 'consent' is the share of non-consented
+# applications that switch to consent (0 by default).
+
+# Allocations (scenarios x runs) one call may ask for
+MAX_WORK = 20000
+WORKERS = min(os.cpu_count() or 1, 4)
+# One pool for the life of the process, started on first use. Its workers are
+# spawned: forking the threaded server could copy a lock held by another thread.
+_pool = None
+_pool_lock = threading.Lock()
+
+# Applications of the campaign, prepared once per batch in the worker
+_prepared = None
+_consent = None
+
+
+def _init(arrays, ops):
+    global _prepared, _consent
+    _prepared = allocation.prepare(arrays['entrant_id'], arrays['op'], arrays['priority'], arrays['total'], ops)
+    _consent = np.asarray(arrays['consent'], dtype=bool)
+
+
+def _run(task):
+    spots, share, seed = task
+    consent = _consent
+    if share:
+        rng = np.random.default_rng(seed)
+        consent = consent | (rng.random(len(consent)) < share)
+    return allocation.allocate_prepared(_prepared, consent, spots)['cutoffs']
+
+
+def _batch(arrays, ops, tasks):
+    # The pool outlives campaigns, so the applications come with each batch
+    _init(arrays, ops)
+    return [_run(task) for task in tasks]
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def shutdown():
+    # Stops the workers with the server; a later run starts a new pool
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def seat_plan(base, scenario):
+    spots = dict(base)
+    for op, extra in (scenario.get('seats') or {}).items():
+        if op not in spots:
+            raise ValueError(f'Unknown program: {op}')
+        spots[op] = max(int(spots[op]) + int(extra), 0)
+    return spots
+
+
+def _summary(cutoffs):
+    # Distribution of one program's cutoff over the runs; None means under-filled
+    scores = np.array([score for score in cutoffs if score is not None], dtype=np.int64)
+    summary = {'runs': len(cutoffs), 'nedobor': len(cutoffs) - len(scores)}
+    if len(scores):
+        p5, p50, p95 = np.percentile(scores, [5, 50, 95]).tolist()
+        summary.update(mean=float(scores.mean()), std=float(scores.std()), min=int(scores.min()),
+                       p5=p5, median=p50, p95=p95, max=int(scores.max()))
+    return summary
+
+
+def run(arrays, base, scenarios, runs=100, seed=0, workers=None):
+    # Every (scenario, run) is one allocation; they are spread over the process pool
+    global _pool
+    if not isinstance(scenarios, list) or not all(isinstance(scenario, dict) for scenario in scenarios):
+        raise ValueError('scenarios must be a list of objects')
+    if len(scenarios) * runs > MAX_WORK:
+        raise ValueError(f'At most {MAX_WORK} allocations per call: {len(scenarios)} scenarios x {runs} runs')
+    arrays = {name: np.asarray(values) for name, values in arrays.items()}
+    tasks = []
+    for index, scenario in enumerate(scenarios):
+        consent = float(scenario.get('consent', 0))
+        if not 0 <= consent <= 1:
+            raise ValueError(f'Consent share must be between 0 and 1: {consent}')
+        spots = seat_plan(base, scenario)
+        # Without a random part one run is enough
+        for i in range(runs if consent else 1):
+            tasks.append((index, (spots, consent, [seed, index, i])))
+    workers = min(workers or WORKERS, len(tasks))
+    if workers <= 1:
+        results = _batch(arrays, list(base), [task for _, task in tasks])
+    else:
+        # One batch per worker, so the applications are sent and prepared once per worker
+        pool = _executor()
+        batches = [[task for _, task in tasks[i::workers]] for i in range(workers)]
+        try:
+            futures = [pool.submit(_batch, arrays, list(base), batch) for batch in batches]
+            done = [future.result() for future in futures]
+        except BrokenProcessPool:
+            # A worker died; the next call starts a new pool
+            with _pool_lock:
+                if _pool is pool:
+                    _pool = None
+            raise
+        results = [None] * len(tasks)
+        for i, batch in enumerate(done):
+            results[i::workers] = batch
+    output = []
+    for index, scenario in enumerate(scenarios):
+        spots = seat_plan(base, scenario)
+        cutoffs = [result for (i, _), result in zip(tasks, results) if i == index]
+        output.append({
+            'name': scenario.get('name') or f'scenario {index + 1}',
+            'seats': spots,
+            'consent': float(scenario.get('consent', 0)),
+            'cutoffs': {op: _summary([c[op] for c in cutoffs]) for op in spots},
+        })
+    return output
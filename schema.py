@@ -0,0 +1,47 @@
+from sqlalchemy import inspect
+
+# Schema version is stored in PRAGMA user_version of the SQLite file
+SCHEMA_VERSION = 2
+
+
+def _integer_score(conn):
+    # passing_score.score was String(20) with "NEDOBOR" for an under-filled program,
+    # now it is an integer and NULL means NEDOBOR
+    conn.exec_driver_sql('CREATE TABLE passing_score_new (id INTEGER NOT NULL, op VARCHAR(10), '
+                         'day VARCHAR(10), score INTEGER, PRIMARY KEY (id))')
+    conn.exec_driver_sql("INSERT INTO passing_score_new (id, op, day, score) "
+                         "SELECT id, op, day, CASE WHEN score = 'NEDOBOR' THEN NULL ELSE CAST(score AS INTEGER) END "
+                         "FROM passing_score")
+    conn.exec_driver_sql('DROP TABLE passing_score')
+    conn.exec_driver_sql('ALTER TABLE passing_score_new RENAME TO passing_score')
+
+
+def _indexes(conn):
+    # Old databases may hold several rows per (entrant_id, op); keep the newest one
+    conn.exec_driver_sql('DELETE FROM application WHERE id NOT IN '
+                         '(SELECT MAX(id) FROM application GROUP BY entrant_id, op)')
+    conn.exec_driver_sql('CREATE UNIQUE INDEX IF NOT EXISTS uq_application_entrant_op '
+                         'ON application (entrant_id, op)')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_application_op_consent_priority '
+                         'ON application (op, consent, priority, entrant_id)')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_entrant_total ON entrant (total)')
+    conn.exec_driver_sql('CREATE INDEX IF NOT EXISTS ix_passing_score_op_day ON passing_score (op, day)')
+
+
+MIGRATIONS = {
+    1: _integer_score,
+    2: _indexes,
+}
+
+
+def setup(engine, metadata):
+    # Create a fresh database at the current version, or migrate an existing one
+    with engine.begin() as conn:
+        version = conn.exec_driver_sql('PRAGMA user_version').scalar()
+        if not inspect(conn).has_table('entrant'):
+            metadata.create_all(conn)
+            version = SCHEMA_VERSION
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            MIGRATIONS[target](conn)
+        metadata.create_all(conn)
+        conn.exec_driver_sql(f'PRAGMA user_version = {SCHEMA_VERSION}')
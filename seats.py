@@ -0,0 +1,46 @@
+import json
+import os
+
+# Seat plan of the campaign: program -> number of budget seats, or an object
+# {"seats": 40, "faculty": "...", "name": "..."} that also places the program in a faculty.
+# Read from seats.json next to this file, or from the file named by SEATS_FILE.
+PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'seats.json')
+
+
+def _read(path=None):
+    path = path or os.environ.get('SEATS_FILE') or PATH
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load(path=None):
+    return validate(_read(path))
+
+
+def entries(path=None):
+    # Programs of the plan in file order: code, name, faculty, seats
+    plan = _read(path)
+    validate(plan)
+    result = []
+    for op, value in plan.items():
+        value = value if isinstance(value, dict) else {'seats': value}
+        result.append({'code': op, 'name': value.get('name') or op, 'faculty': value.get('faculty') or '',
+                       'seats': value['seats']})
+    return result
+
+
+def validate(plan):
+    # Program names end up in SQL column aliases, seats must be non-negative integers
+    if not isinstance(plan, dict) or not plan:
+        raise ValueError('Seat plan must be a non-empty object of program -> seats')
+    spots = {}
+    for op, value in plan.items():
+        if not isinstance(op, str) or not op.isalnum():
+            raise ValueError(f'Bad program name: {op!r}')
+        count = value.get('seats') if isinstance(value, dict) else value
+        if isinstance(count, bool) or not isinstance(count, int) or count < 0:
+            raise ValueError(f'Bad number of seats for {op}: {count!r}')
+        if isinstance(value, dict) and not isinstance(value.get('faculty', ''), str):
+            raise ValueError(f'Bad faculty for {op}: {value["faculty"]!r}')
+        spots[op] = count
+    return spots
@@ -0,0 +1,106 @@
+import itertools
+import threading
+import numpy as np
+import pandas as pd
+import allocation
+import daystore
+import distribution
+import lookup
+import queries
+
+# Process-wide, read-only view of the current campaign. A new snapshot is built
+# after every committed load and swapped in as a whole, so readers never see a
+# half-loaded day and all of them share one copy.
+_current = None
+_lock = threading.Lock()
+_versions = itertools.count(1)
+# Called as callback(previous, snap) after every publish, in the publishing thread
+_listeners = []
+
+
+def _arrays(programs):
+    # Applications as the NumPy columns allocation.allocate expects
+    frames = [frame.assign(op=op) for op, frame in programs.items()]
+    if frames:
+        df = pd.concat(frames, ignore_index=True)
+    else:
+        df = pd.DataFrame(columns=['id', 'op', 'priority', 'total', 'consent'])
+    return {
+        'entrant_id': df['id'].to_numpy(dtype=np.int64),
+        'op': df['op'].to_numpy(dtype=object),
+        'priority': df['priority'].to_numpy(dtype=np.int64),
+        'total': df['total'].to_numpy(dtype=np.int64),
+        'consent': df['consent'].to_numpy(dtype=bool),
+    }
+
+
+class Snapshot:
+    def __init__(self, day, ops, overall, programs, result):
+        self.version = None  # assigned by publish()
+        self.day = day
+        self.ops = list(ops)
+        self.overall = overall  # one row per entrant, "<op> Priority"/"<op> Consent" columns
+        self.programs = programs  # op -> ranked list of the program
+        self.admitted = result['admitted']
+        self.cutoffs = result['cutoffs']
+        self.totals = pd.Series(overall['Total'].to_numpy(), index=overall['ID'].to_numpy())
+        # Per-entrant rank lookups, rebuilt with every snapshot
+        self.index = lookup.RankIndex(self)
+        # Per-program score histograms for the analytics, as prefix sums
+        self.scores = distribution.ScoreDistribution(self)
+
+    def arrays(self):
+        return _arrays(self.programs)
+
+
+def from_frame(frame, ops, spots, day=None, result=None):
+    # frame is the long applications frame, from the database or a stored day
+    overall = queries.pivot_overall(frame, ops)
+    programs = queries.split_programs(frame, ops)
+    if result is None:
+        result = allocation.allocate(**_arrays(programs), spots=spots)
+    return Snapshot(day, ops, overall, programs, result)
+
+
+def build(session, ops, spots, day=None, result=None):
+    return from_frame(queries.applications_frame(session), ops, spots, day, result)
+
+
+def load(day, ops, spots):
+    # A past day, read back from its memory-mapped file
+    return from_frame(daystore.frame(day), ops, spots, day)
+
+
+def subscribe(callback):
+    _listeners.append(callback)
+
+
+def publish(snap):
+    global _current
+    with _lock:
+        previous = _current
+        snap.version = next(_versions)
+        _current = snap
+    for callback in _listeners:
+        callback(previous, snap)
+    return snap
+
+
+def current():
+    return _current
+
+
+def get(session, ops, spots, day=None):
+    # Current snapshot; the first one is built from the database on demand, or
+    # read back from the day file of `day` after a restart
+    global _current
+    snap = _current
+    if snap is None:
+        snap = load(day, ops, spots) if day is not None else build(session, ops, spots)
+        with _lock:
+            # A load may have published a newer snapshot in the meantime
+            if _current is None:
+                snap.version = next(_versions)
+                _current = snap
+            snap = _current
+    return snap
@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import hashlib
+import http.server
+import os
+import time
+from functools import partial
+import httpx
+import metrics
+
+# Competition lists published over HTTP, one URL per program and day, e.g.
+# SOURCE_URL=https://lists.example/{day}_{op}.csv. A poll asks for every list at
+# once over a pool of keep-alive connections, conditionally (If-None-Match /
+# If-Modified-Since), so a list that did not change costs a 304 and nothing else.
+# A list sent in full anyway is hashed while it streams to disk; when the hash
+# matches the last loaded copy it is dropped as well. The validators and hashes
+# live in source_state and are saved only after the lists were loaded.
+CONNECTIONS = 16
+TIMEOUT = 30.0
+BLOCK_SIZE = 64 * 1024
+
+
+def known(session):
+    # url -> validators and hash of the last loaded copy
+    rows = session.connection().exec_driver_sql('SELECT url, etag, last_modified, sha256 FROM source_state')
+    return {url: {'etag': etag, 'last_modified': modified, 'sha256': sha256} for url, etag, modified, sha256 in rows}
+
+
+def save(session, entries):
+    if not entries:
+        return
+    session.connection().exec_driver_sql(
+        'INSERT INTO source_state (url, etag, last_modified, sha256, fetched_at) VALUES (?, ?, ?, ?, ?) '
+        'ON CONFLICT(url) DO UPDATE SET etag = excluded.etag, last_modified = excluded.last_modified, '
+        'sha256 = excluded.sha256, fetched_at = excluded.fetched_at',
+        [(e['url'], e['etag'], e['last_modified'], e['sha256'], e['fetched_at']) for e in entries])
+
+
+async def _fetch_one(client, op, url, target, state):
+    headers = {}
+    if state and state['etag']:
+        headers['If-None-Match'] = state['etag']
+    if state and state['last_modified']:
+        headers['If-Modified-Since'] = state['last_modified']
+    async with client.stream('GET', url, headers=headers) as response:
+        if response.status_code == 304:
+            return op, 'not_modified', None
+        if response.status_code == 404:
+            # The program has no list for the day (yet)
+            return op, 'missing', None
+        response.raise_for_status()
+        digest = hashlib.sha256()
+        size = 0
+        with open(target, 'wb') as f:
+            async for block in response.aiter_bytes(BLOCK_SIZE):
+                digest.update(block)
+                f.write(block)
+                size += len(block)
+    metrics.inc('source_bytes_total', size)
+    entry = {
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'sha256': digest.hexdigest(),
+        'fetched_at': time.time(),
+    }
+    if state and state['sha256'] == entry['sha256']:
+        os.remove(target)
+        return op, 'unchanged', entry
+    return op, 'changed', entry
+
+
+async def fetch_day(day, ops, url, directory, state, connections=CONNECTIONS):
+    # Downloads the changed lists of the day into directory, under the names
+    # ingest expects ({day}_{op}.csv), and tells what happened to each program
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(limits=limits, timeout=TIMEOUT, follow_redirects=True) as client:
+        tasks = []
+        for op in ops:
+            source = url.format(day=day, op=op)
+            target = os.path.join(directory, f'{day}_{op}.csv')
+            tasks.append(_fetch_one(client, op, source, target, state.get(source)))
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    fetched = {'day': day, 'changed': [], 'unchanged': [], 'missing': [], 'errors': {}, 'entries': []}
+    for op, result in zip(ops, results):
+        if isinstance(result, Exception):
+            # A list cut off halfway must not be loaded
+            partial_file = os.path.join(directory, f'{day}_{op}.csv')
+            if os.path.exists(partial_file):
+                os.remove(partial_file)
+            fetched['errors'][op] = str(result) or type(result).__name__
+            metrics.inc('source_requests_total', result='error')
+            continue
+        _, status, entry = result
+        metrics.inc('source_requests_total', result=status)
+        if status == 'changed':
+            fetched['changed'].append(op)
+        elif status == 'missing':
+            fetched['missing'].append(op)
+        else:
+            fetched['unchanged'].append(op)
+        if entry is not None:
+            fetched['entries'].append(entry)
+    return fetched
+
+
+def fetch(day, ops, url, directory, state, connections=CONNECTIONS):
+    # For worker threads: runs the poll on its own event loop
+    return asyncio.run(fetch_day(day, ops, url, directory, state, connections))
+
+
+class StandInHandler(http.server.SimpleHTTPRequestHandler):
+    # Serves a directory of lists the way a publisher would: ETag and Last-Modified
+    # on every file, 304 to a conditional request that still matches.
+    # SimpleHTTPRequestHandler already answers If-Modified-Since.
+    etag = None
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                self.etag = '"' + hashlib.sha256(f.read()).hexdigest()[:32] + '"'
+            if self.headers.get('If-None-Match') == self.etag:
+                self.send_response(304)
+                self.end_headers()
+                return None
+        return super().send_head()
+
+    def end_headers(self):
+        if self.etag:
+            self.send_header('ETag', self.etag)
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(directory, port=8001, host='127.0.0.1'):
+    # Local stand-in for the list publisher; serve_forever() it in a thread for tests
+    return http.server.ThreadingHTTPServer((host, port), partial(StandInHandler, directory=directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in server for the competition lists')
+    parser.add_argument('directory', help='directory with the {day}_{op}.csv files')
+    parser.add_argument('--port', type=int, default=8001)
+    args = parser.parse_args()
+    server = serve(args.directory, args.port)
+    print(f'Serving {args.directory} on http://127.0.0.1:{args.port}/{{day}}_{{op}}.csv')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
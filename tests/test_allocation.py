@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+import allocation
+
+OPS = ['PM', 'IVT', 'ITSS', 'IB']
+
+
+def random_campaign(rng, entrants):
+    # entrant_id -> (total, [(op, priority, consent)]); narrow totals so ties are common
+    campaign = {}
+    for entrant_id in range(1, entrants + 1):
+        ops = rng.choice(OPS, rng.integers(1, len(OPS) + 1), replace=False).tolist()
+        priorities = (rng.permutation(len(ops)) + 1).tolist()
+        applications = [(op, p, bool(rng.random() < 0.7)) for op, p in zip(ops, priorities)]
+        campaign[entrant_id] = (int(rng.integers(150, 180)), applications)
+    return campaign
+
+
+def arrays(campaign, entrant_ids=None):
+    rows = [(entrant_id, op, priority, campaign[entrant_id][0], consent)
+            for entrant_id in (campaign if entrant_ids is None else entrant_ids) if entrant_id in campaign
+            for op, priority, consent in campaign[entrant_id][1]]
+    entrant_id, op, priority, total, consent = zip(*rows) if rows else ((), (), (), (), ())
+    return {
+        'entrant_id': np.array(entrant_id, dtype=np.int64),
+        'op': np.array(op, dtype=object),
+        'priority': np.array(priority, dtype=np.int64),
+        'total': np.array(total, dtype=np.int64),
+        'consent': np.array(consent, dtype=bool),
+    }
+
+
+def change(rng, campaign, next_id):
+    # Deletes, rescores, flips consents and adds entrants; returns the changed ids
+    ids = list(campaign)
+    changed = set()
+    for entrant_id in rng.choice(ids, len(ids) // 10, replace=False).tolist():
+        del campaign[entrant_id]
+        changed.add(entrant_id)
+    for entrant_id in rng.choice(list(campaign), len(campaign) // 5, replace=False).tolist():
+        total, applications = campaign[entrant_id]
+        if rng.random() < 0.5:
+            total += int(rng.integers(-5, 6))
+        applications = [(op, p, not consent if rng.random() < 0.3 else consent) for op, p, consent in applications]
+        campaign[entrant_id] = (total, applications)
+        changed.add(entrant_id)
+    added = random_campaign(rng, len(ids) // 10)
+    for offset, entry in enumerate(added.values()):
+        campaign[next_id + offset] = entry
+        changed.add(next_id + offset)
+    return changed
+
+
+def assert_same(full, incremental):
+    assert full['cutoffs'] == incremental['cutoffs']
+    for op in OPS:
+        assert full['admitted'][op].tolist() == incremental['admitted'][op].tolist(), op
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_incremental_matches_full(seed):
+    rng = np.random.default_rng(seed)
+    spots = {op: int(rng.integers(3, 25)) for op in OPS}
+    campaign = random_campaign(rng, 200)
+    state = allocation.IncrementalAllocation(spots)
+    state.reset(arrays(campaign))
+    assert_same(allocation.allocate(**arrays(campaign), spots=spots), state.result())
+    next_id = 1000
+    for _ in range(4):
+        changed = change(rng, campaign, next_id)
+        next_id += 1000
+        state.update(changed, arrays(campaign, changed))
+        assert_same(allocation.allocate(**arrays(campaign), spots=spots), state.result())
+
+
+def test_update_with_only_deletions():
+    spots = {op: 2 for op in OPS}
+    campaign = random_campaign(np.random.default_rng(3), 30)
+    state = allocation.IncrementalAllocation(spots)
+    state.reset(arrays(campaign))
+    gone = [entrant_id for entrant_id in list(campaign)[:10]]
+    for entrant_id in gone:
+        del campaign[entrant_id]
+    state.update(gone, arrays(campaign, gone))
+    assert_same(allocation.allocate(**arrays(campaign), spots=spots), state.result())
@@ -0,0 +1,107 @@
+import hashlib
+import http.server
+import threading
+import pytest
+import sources
+
+BODY = 'ID,Consent,Priority,Physics,Russian,Math,Individual,Total\n1,True,1,80,70,60,5,215\n'
+
+
+def start(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}/{{day}}_{{op}}.csv'
+
+
+@pytest.fixture
+def publisher(tmp_path):
+    # (published directory, list URL, download directory) around a stand-in server on a free port
+    published = tmp_path / 'published'
+    fetched = tmp_path / 'fetched'
+    published.mkdir()
+    fetched.mkdir()
+    server = sources.serve(str(published), port=0)
+    yield published, start(server), fetched
+    server.shutdown()
+    server.server_close()
+
+
+def poll(url, directory, state=None, ops=('PM',)):
+    return sources.fetch('01.08', list(ops), url, str(directory), state or {})
+
+
+def known(fetched):
+    # What sources.known would read back after sources.save
+    return {entry['url']: entry for entry in fetched['entries']}
+
+
+def test_changed_list_is_written(publisher):
+    published, url, directory = publisher
+    (published / '01.08_PM.csv').write_text(BODY, encoding='utf-8')
+    fetched = poll(url, directory)
+    assert fetched['changed'] == ['PM']
+    assert fetched['errors'] == {}
+    assert (directory / '01.08_PM.csv').read_text(encoding='utf-8') == BODY
+    [entry] = fetched['entries']
+    assert entry['url'] == url.format(day='01.08', op='PM')
+    assert entry['sha256'] == hashlib.sha256(BODY.encode()).hexdigest()
+    assert entry['etag'] and entry['last_modified']
+
+
+def test_repeat_poll_is_not_modified(publisher):
+    published, url, directory = publisher
+    (published / '01.08_PM.csv').write_text(BODY, encoding='utf-8')
+    first = poll(url, directory)
+    (directory / '01.08_PM.csv').unlink()
+    again = poll(url, directory, known(first))
+    # A 304 brings no body and no new validators
+    assert again['unchanged'] == ['PM']
+    assert again['changed'] == []
+    assert again['entries'] == []
+    assert not (directory / '01.08_PM.csv').exists()
+
+
+def test_full_body_with_the_same_hash_is_unchanged(publisher):
+    published, url, directory = publisher
+    (published / '01.08_PM.csv').write_text(BODY, encoding='utf-8')
+    # Without validators the list is sent in full; only its hash is known
+    state = {url.format(day='01.08', op='PM'): {'etag': None, 'last_modified': None,
+                                                'sha256': hashlib.sha256(BODY.encode()).hexdigest()}}
+    fetched = poll(url, directory, state)
+    assert fetched['unchanged'] == ['PM']
+    assert fetched['changed'] == []
+    assert len(fetched['entries']) == 1
+    assert not (directory / '01.08_PM.csv').exists()
+
+
+def test_missing_list(publisher):
+    published, url, directory = publisher
+    (published / '01.08_PM.csv').write_text(BODY, encoding='utf-8')
+    fetched = poll(url, directory, ops=['PM', 'IB'])
+    assert fetched['changed'] == ['PM']
+    assert fetched['missing'] == ['IB']
+    assert not (directory / '01.08_IB.csv').exists()
+
+
+class CutOffHandler(http.server.BaseHTTPRequestHandler):
+    # Promises more than it sends, then closes the connection
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(BODY) * 10))
+        self.end_headers()
+        self.wfile.write(BODY.encode())
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_broken_transfer_removes_the_partial_file(tmp_path):
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), CutOffHandler)
+    try:
+        fetched = poll(start(server), tmp_path)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert fetched['changed'] == []
+    assert fetched['entries'] == []
+    assert fetched['errors']['PM']
+    assert not (tmp_path / '01.08_PM.csv').exists()
@@ -0,0 +1,128 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+import ingest
+import validate
+
+HEADER = 'ID,Consent,Priority,Physics,Russian,Math,Individual,Total'
+
+
+@pytest.fixture
+def session():
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        conn.exec_driver_sql('CREATE TABLE entrant (id INTEGER PRIMARY KEY, phys INTEGER, rus INTEGER, '
+                             'math INTEGER, ind INTEGER, total INTEGER)')
+        conn.exec_driver_sql('CREATE TABLE application (id INTEGER PRIMARY KEY, entrant_id INTEGER NOT NULL, '
+                             'op VARCHAR(10), priority INTEGER, consent BOOLEAN)')
+        conn.exec_driver_sql('CREATE UNIQUE INDEX uq_application_entrant_op ON application (entrant_id, op)')
+        conn.exec_driver_sql('CREATE TABLE quarantine (id INTEGER PRIMARY KEY, day VARCHAR(10), op VARCHAR(10), '
+                             'line INTEGER, entrant_id INTEGER, reason VARCHAR(500), data TEXT)')
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def lists(tmp_path):
+    # write(op, *rows) -> the day's CSV of op; load(ops) runs them through load_csvs two rows per chunk
+    def write(op, *rows, header=HEADER):
+        (tmp_path / f'01.08_{op}.csv').write_text('\n'.join([header, *rows]) + '\n', encoding='utf-8')
+
+    def load(session, ops):
+        return ingest.load_csvs(session, '01.08', ops, str(tmp_path / '{day}_{op}.csv'), chunksize=2)
+
+    return write, load
+
+
+def quarantined(session):
+    return [(row['op'], row['line'], row['entrant_id'], row['reason']) for row in validate.rows(session, '01.08')]
+
+
+def applications(session):
+    return session.connection().exec_driver_sql('SELECT entrant_id, op FROM application ORDER BY op, entrant_id').fetchall()
+
+
+def test_clean_list_loads_every_row(session, lists):
+    write, load = lists
+    write('PM', '1,True,1,80,70,60,5,215', '2,False,2,50,50,50,0,150', '3,1,1,10,20,30,4,64')
+    stats = load(session, ['PM'])
+    assert stats['quarantined'] == 0
+    assert quarantined(session) == []
+    assert applications(session) == [(1, 'PM'), (2, 'PM'), (3, 'PM')]
+
+
+def test_bad_values_are_quarantined_with_reasons(session, lists):
+    write, load = lists
+    write('PM',
+          '1,True,1,80,70,60,5,215',
+          '2,True,1,abc,70,60,5,215',
+          '3,True,1,80.5,70,60,5,215.5',
+          '4,True,1,,70,60,5,135',
+          '5,True,1,150,70,60,5,285',
+          '6,True,1,80,70,60,5,216',
+          '7,maybe,1,80,70,60,5,215',
+          '8,True,0,80,70,60,5,215',
+          f'{2 ** 47},True,1,80,70,60,5,215')
+    stats = load(session, ['PM'])
+    assert stats['quarantined'] == 8
+    reasons = {entrant_id or line: reason for _, line, entrant_id, reason in quarantined(session)}
+    assert reasons[2] == 'phys: not a number'
+    assert reasons[3].startswith('phys: not an integer')
+    assert reasons[4] == 'phys: empty'
+    assert reasons[5] == 'phys: outside 0..100'
+    assert reasons[6] == 'total: not the sum of the scores'
+    assert reasons[7] == 'consent: not yes/no'
+    assert reasons[8] == 'priority: outside 1..32767'
+    assert reasons[10] == f'id: outside 1..{2 ** 47 - 1}'
+    assert applications(session) == [(1, 'PM')]
+
+
+def test_duplicate_id_across_chunks_keeps_the_first(session, lists):
+    write, load = lists
+    write('PM', '1,True,1,80,70,60,5,215', '2,True,1,50,50,50,0,150', '3,True,1,50,50,50,0,150',
+          '1,True,1,10,10,10,0,30')
+    load(session, ['PM'])
+    assert quarantined(session) == [('PM', 5, 1, 'id: listed twice in the program')]
+    total = session.connection().exec_driver_sql('SELECT total FROM entrant WHERE id = 1').scalar()
+    assert total == 215
+
+
+def test_priority_clash_across_programs(session, lists):
+    write, load = lists
+    write('PM', '1,True,1,80,70,60,5,215', '2,True,2,50,50,50,0,150')
+    write('IB', '2,True,1,50,50,50,0,150', '3,True,1,10,10,10,0,30', '1,True,1,80,70,60,5,215')
+    load(session, ['PM', 'IB'])
+    assert quarantined(session) == [('IB', 4, 1, 'priority: already used by the entrant for another program')]
+    assert applications(session) == [(2, 'IB'), (3, 'IB'), (1, 'PM'), (2, 'PM')]
+
+
+def test_missing_column_quarantines_the_file_and_unknown_ones_are_skipped(session, lists):
+    write, load = lists
+    write('PM', '1,True,1,80,60,5,215,x', '2,True,1,50,50,0,150,y',
+          header='ID,Consent,Priority,Physics,Math,Individual,Total,Comment')
+    write('IB', '3,True,1,10,10,10,0,30', header=HEADER + ',Comment')
+    stats = load(session, ['PM', 'IB'])
+    assert stats['quarantined'] == 2
+    assert all(op == 'PM' and reason.startswith('rus: ') for op, _, _, reason in quarantined(session))
+    assert applications(session) == [(3, 'IB')]
+
+
+def test_russian_headers(session, lists):
+    write, load = lists
+    write('PM', '1,Да,1,80,70,60,5,215', '2,Нет,2,50,50,50,0,150',
+          header='ID,Согласие,Приоритет,Физика/ИКТ,Русский язык,Математика,ИД,Всего')
+    stats = load(session, ['PM'])
+    assert stats['quarantined'] == 0
+    consent = session.connection().exec_driver_sql('SELECT consent FROM application ORDER BY entrant_id').fetchall()
+    assert consent == [(1,), (0,)]
+
+
+def test_reload_replaces_the_quarantine_of_the_loaded_programs(session, lists):
+    write, load = lists
+    write('PM', '1,True,1,80,70,60,5,999')
+    write('IB', '2,True,1,80,70,60,5,999')
+    load(session, ['PM', 'IB'])
+    assert len(quarantined(session)) == 2
+    write('PM', '1,True,1,80,70,60,5,215')
+    load(session, ['PM'])
+    assert [op for op, *_ in quarantined(session)] == ['IB']
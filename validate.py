@@ -0,0 +1,150 @@
+import json
+import numpy as np
+import pandas as pd
+
+# Row checks of the ingest pipeline, run on whole chunks with column-wise
+# predicates. A row failing any check is set aside in the quarantine table with
+# its reasons and raw values; the rest of the day loads as usual.
+SCORES = ['phys', 'rus', 'math', 'ind']
+# (entrant, priority) pairs are packed into one int64 key, id * PRIORITY_SPAN + priority,
+# which bounds ids to 2 ** 47 and priorities to PRIORITY_SPAN - 1
+PRIORITY_SPAN = 1 << 16
+RANGES = {'id': (1, 2 ** 47 - 1), 'phys': (0, 100), 'rus': (0, 100), 'math': (0, 100), 'ind': (0, 10),
+          'total': (0, 310), 'priority': (1, 32767)}
+
+
+def _member(seen, keys):
+    # seen is sorted: a binary search per key, cheaper than np.isin on large sets
+    if not len(seen):
+        return np.zeros(len(keys), dtype=bool)
+    positions = np.minimum(np.searchsorted(seen, keys), len(seen) - 1)
+    return seen[positions] == keys
+
+
+def _merge(seen, keys):
+    merged = np.concatenate([seen, keys])
+    merged.sort()
+    return merged
+
+
+class DayCheck:
+    # Checks the chunks of one day in order. Across chunks it remembers the ids
+    # already listed per program and the priorities each entrant already used,
+    # so the first occurrence is loaded and later ones are quarantined.
+    def __init__(self, true_values, false_values, dtypes):
+        self.true_values = true_values
+        self.false_values = false_values
+        self.dtypes = dtypes
+        self.listed = {}  # op -> sorted ids
+        self.taken = np.empty(0, dtype=np.int64)  # sorted (entrant, priority) keys
+        self.rejected = []  # quarantined rows: (op, line, entrant_id, reason, data)
+
+    def _numbers(self, chunk, column, fails):
+        if column not in chunk:
+            fails.append((np.ones(len(chunk), dtype=bool), f'{column}: column missing'))
+            return pd.Series(np.nan, index=chunk.index)
+        raw = chunk[column]
+        if pd.api.types.is_integer_dtype(raw):
+            values = raw
+        else:
+            values = pd.to_numeric(raw, errors='coerce')
+            absent = raw.isna().to_numpy()
+            fails.append((absent, f'{column}: empty'))
+            fails.append((values.isna().to_numpy() & ~absent, f'{column}: not a number'))
+            fails.append(((values % 1 != 0).to_numpy() & values.notna().to_numpy(), f'{column}: not an integer'))
+        low, high = RANGES[column]
+        fails.append((((values < low) | (values > high)).to_numpy(), f'{column}: outside {low}..{high}'))
+        return values
+
+    def _consent(self, chunk, fails):
+        if 'consent' not in chunk:
+            fails.append((np.ones(len(chunk), dtype=bool), 'consent: column missing'))
+            return pd.Series(False, index=chunk.index)
+        raw = chunk['consent']
+        if pd.api.types.is_bool_dtype(raw):
+            return raw
+        text = raw.astype(str).str.strip()
+        truth = text.isin(self.true_values)
+        fails.append(((~truth & ~text.isin(self.false_values)).to_numpy(), 'consent: not yes/no'))
+        return truth
+
+    def __call__(self, chunk):
+        # Returns the good rows, typed; the bad ones are kept in self.rejected
+        fails = []
+        values = {column: self._numbers(chunk, column, fails) for column in RANGES}
+        values['consent'] = self._consent(chunk, fails)
+        bad = np.zeros(len(chunk), dtype=bool)
+        for mask, _ in fails:
+            bad |= mask
+        # Only rows with sound scores are compared with their total
+        mismatch = (values['total'] != sum(values[column] for column in SCORES)).to_numpy() & ~bad
+        fails.append((mismatch, 'total: not the sum of the scores'))
+        bad |= mismatch
+        ids = values['id'].to_numpy()
+        ops = chunk['op'].to_numpy()
+        # Duplicates are judged among rows that are otherwise fine
+        duplicate = np.zeros(len(chunk), dtype=bool)
+        candidates = np.flatnonzero(~bad)
+        for op in pd.unique(ops[candidates]):
+            rows = candidates[ops[candidates] == op]
+            op_ids = ids[rows].astype(np.int64)
+            seen = self.listed.get(op, np.empty(0, dtype=np.int64))
+            repeat = pd.Series(op_ids).duplicated().to_numpy() | _member(seen, op_ids)
+            duplicate[rows[repeat]] = True
+            self.listed[op] = _merge(seen, op_ids[~repeat])
+        fails.append((duplicate, 'id: listed twice in the program'))
+        bad |= duplicate
+        good = np.flatnonzero(~bad)
+        keys = ids[good].astype(np.int64) * PRIORITY_SPAN + values['priority'].to_numpy()[good].astype(np.int64)
+        clash = pd.Series(keys).duplicated().to_numpy() | _member(self.taken, keys)
+        conflict = np.zeros(len(chunk), dtype=bool)
+        conflict[good[clash]] = True
+        fails.append((conflict, 'priority: already used by the entrant for another program'))
+        bad |= conflict
+        self.taken = _merge(self.taken, keys[~clash])
+        if bad.any():
+            self._reject(chunk, bad, fails, ids)
+        accepted = chunk.loc[~bad, ['op', 'line']].copy()
+        for column in RANGES:
+            accepted[column] = values[column][~bad]
+        accepted['consent'] = values['consent'][~bad]
+        return accepted.astype(self.dtypes)
+
+    def _reject(self, chunk, bad, fails, ids):
+        # Only the bad rows are gone through one by one, for their reasons and raw values
+        rows = np.flatnonzero(bad)
+        masks = np.column_stack([mask[rows] for mask, _ in fails])
+        reasons = [reason for _, reason in fails]
+        raw = chunk.iloc[rows].drop(columns=['op', 'line'])
+        raw = raw.astype(object).where(raw.notna(), None).to_dict('records')
+        # Columns holding an empty cell are parsed as floats: 8.0 is shown as 8
+        raw = [{key: int(value) if isinstance(value, float) and value.is_integer() else value
+                for key, value in row.items()} for row in raw]
+        lines = chunk['line'].to_numpy()[rows].tolist()
+        for i, row in enumerate(rows.tolist()):
+            entrant_id = ids[row]
+            self.rejected.append((
+                chunk['op'].iat[row],
+                lines[i],
+                # Unreadable or out of range ids (which may not fit SQLite's INTEGER) are kept in data only
+                int(entrant_id) if RANGES['id'][0] <= entrant_id <= RANGES['id'][1] and entrant_id % 1 == 0 else None,
+                '; '.join(reason for reason, failed in zip(reasons, masks[i]) if failed),
+                json.dumps(raw[i], default=str, ensure_ascii=False),
+            ))
+
+
+def store(session, day, ops, rejected):
+    # Replaces the quarantine of the loaded programs of the day
+    conn = session.connection()
+    conn.exec_driver_sql('DELETE FROM quarantine WHERE day = ? AND op IN (SELECT value FROM json_each(?))',
+                         (day, json.dumps(sorted(ops))))
+    if rejected:
+        conn.exec_driver_sql('INSERT INTO quarantine (day, op, line, entrant_id, reason, data) VALUES (?, ?, ?, ?, ?, ?)',
+                             [(day, *row) for row in rejected])
+
+
+def rows(session, day):
+    result = session.connection().exec_driver_sql(
+        'SELECT op, line, entrant_id, reason, data FROM quarantine WHERE day = ? ORDER BY id', (day,))
+    return [{'op': op, 'line': line, 'entrant_id': entrant_id, 'reason': reason, 'data': json.loads(data)}
+            for op, line, entrant_id, reason, data in result]